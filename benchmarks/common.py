@@ -0,0 +1,197 @@
+# common.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Shared helpers for the benchmarks. Run them from the repository root, e.g.
+#   python -m benchmarks.image_pipeline
+
+import os, sys, re, glob, json, time, shutil, resource, tracemalloc, platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+themes_dir = os.path.join(root_dir, "src", "themes")
+baselines_dir = os.path.join(root_dir, "benchmarks", "baselines")
+
+# Makes `import src.image_modifier` work without installing the app
+if(root_dir not in sys.path):
+    sys.path.insert(0, root_dir)
+
+# Lays the sources out like the meson install does, widgets and theme
+# folders flattened into a single `rewaita` package, and makes it importable
+def stage_package(directory):
+    module_dir = os.path.join(directory, "rewaita")
+    os.makedirs(module_dir, exist_ok=True)
+
+    src_dir = os.path.join(root_dir, "src")
+    for path in glob.glob(os.path.join(src_dir, "*.py")) + glob.glob(os.path.join(src_dir, "widgets", "*.py")) + glob.glob(os.path.join(themes_dir, "*.css")):
+        shutil.copy(path, module_dir)
+    for name in ["window-controls", "dark", "light", "gtk3-template"]:
+        shutil.copytree(os.path.join(themes_dir, name), os.path.join(module_dir, name), dirs_exist_ok=True)
+
+    if(directory not in sys.path):
+        sys.path.insert(0, directory)
+    return module_dir
+
+def read_proc_io(field):
+    try:
+        with open("/proc/self/io", "r") as file:
+            for line in file:
+                if(line.startswith(field + ":")):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def read_palette(theme_type, theme):
+    # Same pattern the applier uses, without pulling in GTK
+    with open(os.path.join(themes_dir, theme_type, theme), "r") as file:
+        css = file.read()
+    return [value for name, value in re.findall(r'@define-color\s+([a-z0-9_]+)\s+(#[a-fA-F0-9]+);', css)]
+
+def read_rss_kb(field):
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if(line.startswith(field + ":")):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux 4.0+)
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_kb():
+    peak = read_rss_kb("VmHWM")
+    if(peak is None):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak
+
+# Runs func `repeat` times for the wall time, then once more under tracemalloc.
+# Timing runs are kept separate because tracemalloc slows down Python-heavy code.
+def measure(func, repeat=3):
+    times = []
+    reset_peak_rss()
+    rss_start = read_rss_kb("VmRSS") or 0
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - begin)
+    rss_peak = peak_rss_kb()
+
+    tracemalloc.start()
+    func()
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "wall_ms": min(times) * 1000,
+        "wall_ms_median": sorted(times)[len(times) // 2] * 1000,
+        "rss_peak_mb": rss_peak / 1024,
+        "rss_growth_mb": max(rss_peak - rss_start, 0) / 1024,
+        "tracemalloc_peak_mb": traced_peak / (1024 * 1024),
+    }
+
+# Every case gets a fresh interpreter so the peak RSS of one stage does not leak into the next
+def run_isolated(func, *args):
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            return executor.submit(func, *args).result()
+    except BrokenProcessPool:
+        return {"error": "worker died (out of memory?)"}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "platform": platform.platform(),
+    }
+
+def load_baseline(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def save_results(path, results):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"machine": machine_info(), "results": results}, file, indent=2, sort_keys=True)
+
+# Returns the metrics that got worse than the baseline by more than `threshold` (0.1 = 10%)
+def compare(results, baseline, threshold, metrics):
+    regressions = []
+    for name, result in results.items():
+        old = baseline["results"].get(name)
+        if(old is None or "error" in result or "error" in old):
+            continue
+        for metric in metrics:
+            if(metric in result and old.get(metric) and result[metric] > old[metric] * (1 + threshold)):
+                regressions.append((name, metric, old[metric], result[metric]))
+    return regressions
+
+def print_table(results, metrics, baseline=None):
+    print(f"{'case':<40}" + "".join(f"{metric:>22}" for metric in metrics))
+    for name, result in results.items():
+        if("error" in result):
+            print(f"{name:<40}  {result['error']}")
+            continue
+        row = f"{name:<40}"
+        old = baseline["results"].get(name, {}) if baseline else {}
+        for metric in metrics:
+            value = result.get(metric)
+            cell = "-" if value is None else f"{value:.2f}"
+            if(value is not None and old.get(metric)):
+                cell += f" ({(value / old[metric] - 1) * 100:+.0f}%)"
+            row += f"{cell:>22}"
+        print(row)
+
+def report(results, metrics, baseline_path, save_baseline, threshold):
+    baseline = None if save_baseline else load_baseline(baseline_path)
+    print_table(results, metrics, baseline)
+
+    if(save_baseline):
+        save_results(baseline_path, results)
+        print(f"\nBaseline saved to {baseline_path}")
+        return 0
+
+    if(baseline is None):
+        print(f"\nNo baseline at {baseline_path}, run with --save-baseline to create one")
+        return 0
+
+    regressions = compare(results, baseline, threshold, metrics)
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name} {metric}: {old:.2f} -> {new:.2f}")
+    return 1 if regressions else 0
@@ -0,0 +1,173 @@
+# fake_session.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Stand-ins for the settings portal and GNOME Shell's extension interface, so the
+# apply path can run on a private session bus with no desktop. start() launches
+# a dbus-daemon and this module as the service, and returns the bus address.
+
+import os, sys, subprocess, signal, atexit
+import gi
+from gi.repository import Gio, GLib
+
+portal_xml = """
+<node>
+  <interface name="org.freedesktop.portal.Settings">
+    <method name="ReadAll">
+      <arg type="as" name="namespaces" direction="in"/>
+      <arg type="a{sa{sv}}" name="value" direction="out"/>
+    </method>
+    <method name="Read">
+      <arg type="s" name="namespace" direction="in"/>
+      <arg type="s" name="key" direction="in"/>
+      <arg type="v" name="value" direction="out"/>
+    </method>
+    <method name="ReadOne">
+      <arg type="s" name="namespace" direction="in"/>
+      <arg type="s" name="key" direction="in"/>
+      <arg type="v" name="value" direction="out"/>
+    </method>
+    <signal name="SettingChanged">
+      <arg type="s" name="namespace"/>
+      <arg type="s" name="key"/>
+      <arg type="v" name="value"/>
+    </signal>
+    <property name="version" type="u" access="read"/>
+  </interface>
+</node>
+"""
+
+shell_xml = """
+<node>
+  <interface name="org.gnome.Shell.Extensions">
+    <method name="DisableExtension">
+      <arg type="s" name="uuid" direction="in"/>
+      <arg type="b" name="success" direction="out"/>
+    </method>
+    <method name="EnableExtension">
+      <arg type="s" name="uuid" direction="in"/>
+      <arg type="b" name="success" direction="out"/>
+    </method>
+  </interface>
+</node>
+"""
+
+# Lets the benchmark switch between light and dark without a desktop
+control_xml = """
+<node>
+  <interface name="io.github.swordpuffin.rewaita.FakeSession">
+    <method name="SetColorScheme">
+      <arg type="u" name="value" direction="in"/>
+    </method>
+    <method name="GetShellCalls">
+      <arg type="u" name="count" direction="out"/>
+    </method>
+  </interface>
+</node>
+"""
+
+class FakeSession:
+    def __init__(self):
+        self.values = {
+            ("org.freedesktop.appearance", "color-scheme"): GLib.Variant("u", 0),
+            ("org.freedesktop.appearance", "accent-color"): GLib.Variant("(ddd)", (0.21, 0.52, 0.89)),
+        }
+        self.shell_calls = 0
+
+    def on_portal_call(self, connection, sender, path, interface, method, params, invocation):
+        if(method == "ReadAll"):
+            namespaces = {}
+            for (namespace, key), value in self.values.items():
+                namespaces.setdefault(namespace, {})[key] = value
+            invocation.return_value(GLib.Variant("(a{sa{sv}})", (namespaces,)))
+            return
+
+        value = self.values.get(tuple(params.unpack()))
+        if(value is None):
+            invocation.return_dbus_error("org.freedesktop.portal.Error.NotFound", "Requested setting not found")
+        elif(method == "Read"):
+            # The old method wraps the value in a second variant
+            invocation.return_value(GLib.Variant("(v)", (GLib.Variant("v", value),)))
+        else:
+            invocation.return_value(GLib.Variant("(v)", (value,)))
+
+    def on_portal_property(self, connection, sender, path, interface, name):
+        return GLib.Variant("u", 2)
+
+    def on_shell_call(self, connection, sender, path, interface, method, params, invocation):
+        self.shell_calls += 1
+        invocation.return_value(GLib.Variant("(b)", (True,)))
+
+    def on_control_call(self, connection, sender, path, interface, method, params, invocation):
+        if(method == "SetColorScheme"):
+            value = GLib.Variant("u", params.unpack()[0])
+            self.values[("org.freedesktop.appearance", "color-scheme")] = value
+            connection.emit_signal(None, "/org/freedesktop/portal/desktop", "org.freedesktop.portal.Settings", "SettingChanged",
+                GLib.Variant("(ssv)", ("org.freedesktop.appearance", "color-scheme", value)))
+            invocation.return_value(None)
+        else:
+            invocation.return_value(GLib.Variant("(u)", (self.shell_calls,)))
+
+    def on_bus_acquired(self, connection, name):
+        portal = Gio.DBusNodeInfo.new_for_xml(portal_xml).interfaces[0]
+        connection.register_object("/org/freedesktop/portal/desktop", portal, self.on_portal_call, self.on_portal_property, None)
+        shell = Gio.DBusNodeInfo.new_for_xml(shell_xml).interfaces[0]
+        connection.register_object("/org/gnome/Shell/Extensions", shell, self.on_shell_call, None, None)
+        control = Gio.DBusNodeInfo.new_for_xml(control_xml).interfaces[0]
+        connection.register_object("/io/github/swordpuffin/rewaita/FakeSession", control, self.on_control_call, None, None)
+
+    def run(self):
+        names = ["org.freedesktop.portal.Desktop", "org.gnome.Shell.Extensions", "io.github.swordpuffin.rewaita.FakeSession"]
+        pending = set(names)
+
+        def on_name_acquired(connection, name):
+            pending.discard(name)
+            if(not pending):
+                print("ready", flush=True)
+
+        for name in names:
+            Gio.bus_own_name(Gio.BusType.SESSION, name, Gio.BusNameOwnerFlags.NONE,
+                self.on_bus_acquired if name == names[0] else None, on_name_acquired, None)
+        GLib.MainLoop().run()
+
+def start():
+    daemon = subprocess.Popen(["dbus-daemon", "--session", "--nofork", "--print-address=1"], stdout=subprocess.PIPE, text=True)
+    address = daemon.stdout.readline().strip()
+    os.environ["DBUS_SESSION_BUS_ADDRESS"] = address
+
+    service = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_session"], stdout=subprocess.PIPE, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if(service.stdout.readline().strip() != "ready"):
+        raise RuntimeError("Fake session services did not start")
+
+    def stop():
+        for process in [service, daemon]:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+    atexit.register(stop)
+    return address
+
+def call_control(method, params=None, reply_type=None):
+    bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+    result = bus.call_sync("io.github.swordpuffin.rewaita.FakeSession", "/io/github/swordpuffin/rewaita/FakeSession",
+        "io.github.swordpuffin.rewaita.FakeSession", method, params,
+        GLib.VariantType(reply_type) if reply_type else None, Gio.DBusCallFlags.NONE, -1, None)
+    return result.unpack() if reply_type else None
+
+if(__name__ == "__main__"):
+    FakeSession().run()
@@ -0,0 +1,254 @@
+# gtk3_css.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Size and parse cost of the GTK3 stylesheet before and after css_optimizer.
+# It also checks that both sheets give every selector the same final value for
+# each property, in the same cascade order, read with a parser separate from
+# the optimizer's. When PyGObject with GTK 3 is installed, it times
+# Gtk.CssProvider parsing both sheets, compares their parse errors, and runs
+# the same check on what GTK itself parsed (Gtk.CssProvider.to_string).
+#
+#   python -m benchmarks.gtk3_css
+#   python -m benchmarks.gtk3_css --themes "Nord ❄️.css" --controls macos
+
+import os, re, sys, time, argparse
+
+from benchmarks.common import themes_dir, baselines_dir, run_isolated, report
+
+metrics = ["optimized_kb", "optimize_ms", "gtk3_parse_ms"]
+template_dir = os.path.join(themes_dir, "gtk3-template")
+
+def read_colors(theme_type, theme):
+    with open(os.path.join(themes_dir, theme_type, theme), "r") as file:
+        css = file.read()
+    colors = {}
+    for name, value in re.findall(r'@define-color\s+([a-z0-9_]+)\s+(#[a-fA-F0-9]+|@[a-z0-9_]+);', css):
+        colors[name] = colors.get(value[1:], value) if value.startswith("@") else value
+    return colors
+
+# The same steps as ThemeApplier.get_gtk3_template, without the cache
+def read_template(window_control, transparency):
+    with open(os.path.join(template_dir, "gtk.css"), "r") as file:
+        css = file.read()
+    if(window_control != "default"):
+        with open(os.path.join(template_dir, "window-controls", f"{window_control}.css"), "r") as file:
+            css += "\n" + file.read()
+    if(transparency):
+        css += ".background:not(.nautilus-desktop) { opacity: 0.95; }"
+    return css
+
+# The same substitution as utils.parse_gtk_theme, without GTK
+def render(css, theme_type, theme):
+    colors = read_colors(theme_type, theme)
+    colors["accent_color"] = colors.get("blue_3", "#3584e4")
+    colors["border_color"] = "transparent"
+    for color in colors.keys():
+        css = css.replace(f"@{color}", colors[color])
+    return css
+
+# Splits text on separator where it is outside quotes, () and []
+def split_outside(text, separator):
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    index = 0
+    while(index < len(text)):
+        char = text[index]
+        if(quote):
+            if(char == "\\"):
+                index += 1
+            elif(char == quote):
+                quote = None
+        elif(char in "\"'"):
+            quote = char
+        elif(char in "(["):
+            depth += 1
+        elif(char in ")]"):
+            depth -= 1
+        elif(char == separator and depth == 0):
+            parts.append(text[start:index])
+            start = index + 1
+        index += 1
+    parts.append(text[start:])
+    return parts
+
+# Comments out, and whitespace reduced to what still means something, outside strings
+def normalize(css):
+    output = []
+    for index, part in enumerate(re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', css)):
+        if(index % 2 == 0):
+            part = re.sub(r'/\*.*?\*/', ' ', part, flags=re.S)
+            part = re.sub(r'\s+', ' ', part)
+            part = re.sub(r' ?([,>+~(){};:!]) ?', r'\1', part)
+        output.append(part)
+    return "".join(output).strip()
+
+# Top level statements and (prelude, body) blocks, found by brace depth only
+def top_level(css):
+    statements = []
+    blocks = []
+    depth = 0
+    start = 0
+    prelude = None
+    quote = None
+    index = 0
+    while(index < len(css)):
+        char = css[index]
+        if(quote):
+            if(char == "\\"):
+                index += 1
+            elif(char == quote):
+                quote = None
+        elif(char in "\"'"):
+            quote = char
+        elif(char == "{"):
+            if(depth == 0):
+                prelude = css[start:index]
+                start = index + 1
+            depth += 1
+        elif(char == "}"):
+            depth -= 1
+            if(depth == 0):
+                blocks.append((prelude.strip(), css[start:index]))
+                start = index + 1
+        elif(char == ";" and depth == 0):
+            statements.append(css[start:index].strip())
+            start = index + 1
+        index += 1
+    return statements, blocks
+
+# Every selector's winning value for each property, and for each property the
+# order in which selectors win. Two sheets with the same cascade look the same.
+# This has its own parser, so the check does not rely on css_optimizer's.
+def cascade(css):
+    statements, blocks = top_level(normalize(css))
+
+    defined = {}
+    for statement in statements:
+        if(statement.startswith("@define-color ")):
+            name, value = statement[len("@define-color "):].split(" ", 1)
+            defined[name] = value.replace(" ", "")
+
+    winners = {}
+    position = 0
+    for prelude, body in blocks:
+        if(prelude.startswith("@")):
+            continue
+        declarations = []
+        for declaration in split_outside(body, ";"):
+            if(":" not in declaration):
+                continue
+            name, value = declaration.split(":", 1)
+            important = value.endswith("!important")
+            declarations.append((name.strip().lower(), value[:-len("!important")] if important else value, important))
+        for selector in split_outside(prelude, ","):
+            for name, value, important in declarations:
+                position += 1
+                key = (selector, name)
+                if(key not in winners or important or not winners[key][2]):
+                    winners[key] = (position, value, important)
+
+    values = {key: (value, important) for key, (position, value, important) in winners.items()}
+    order = {}
+    for (selector, name), (position, value, important) in sorted(winners.items(), key=lambda item: item[1][0]):
+        order.setdefault(name, []).append(selector)
+    return values, order, defined
+
+def parse_gtk3(css, repeat):
+    import gi
+    gi.require_version("Gtk", "3.0")
+    from gi.repository import Gtk
+
+    errors = []
+    times = []
+    for _ in range(repeat):
+        provider = Gtk.CssProvider()
+        provider.connect("parsing-error", lambda provider, section, error: errors.append(error.message))
+        begin = time.perf_counter()
+        provider.load_from_data(css.encode())
+        times.append(time.perf_counter() - begin)
+    return {"ms": min(times) * 1000, "errors": len(errors) // repeat, "parsed": provider.to_string()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure what css_optimizer saves on the GTK3 stylesheet")
+    parser.add_argument("--themes", nargs="+", default=["Catppuccin Macchiato 🌺.css"])
+    parser.add_argument("--controls", nargs="+", default=["default", "colored", "macos"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=os.path.join(baselines_dir, "gtk3_css.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    from src.css_optimizer import optimize_css
+
+    results = {}
+    failed = False
+    for theme in args.themes:
+        theme_type = "dark" if os.path.exists(os.path.join(themes_dir, "dark", theme)) else "light"
+        for window_control in args.controls:
+            for transparency in [False, True]:
+                name = f"{theme}/{window_control}{'/transparent' if transparency else ''}"
+                template = read_template(window_control, transparency)
+
+                # The app optimizes the template once and only fills in colors on apply
+                times = []
+                for _ in range(args.repeat):
+                    begin = time.perf_counter()
+                    optimized_template = optimize_css(template)
+                    times.append(time.perf_counter() - begin)
+
+                css = render(template, theme_type, theme)
+                optimized = render(optimized_template, theme_type, theme)
+
+                result = {
+                    "raw_kb": len(css.encode()) / 1024,
+                    "optimized_kb": len(optimized.encode()) / 1024,
+                    "optimize_ms": min(times) * 1000,
+                }
+
+                if(cascade(css) != cascade(optimized)):
+                    print(f"MISMATCH {name}: the optimized sheet does not resolve to the same styles", file=sys.stderr)
+                    failed = True
+
+                raw_parse = run_isolated(parse_gtk3, css, args.repeat)
+                optimized_parse = run_isolated(parse_gtk3, optimized, args.repeat)
+                if("error" not in raw_parse and "error" not in optimized_parse):
+                    result["gtk3_parse_raw_ms"] = raw_parse["ms"]
+                    result["gtk3_parse_ms"] = optimized_parse["ms"]
+                    if(raw_parse["errors"] != optimized_parse["errors"]):
+                        print(f"MISMATCH {name}: {raw_parse['errors']} parse errors before, {optimized_parse['errors']} after", file=sys.stderr)
+                        failed = True
+                    if(cascade(raw_parse["parsed"])[:2] != cascade(optimized_parse["parsed"])[:2]):
+                        print(f"MISMATCH {name}: GTK resolves the optimized sheet to different styles", file=sys.stderr)
+                        failed = True
+                results[name] = result
+
+    for name, result in results.items():
+        line = f"{name}: {result['raw_kb']:.0f} KB -> {result['optimized_kb']:.0f} KB"
+        if("gtk3_parse_ms" in result):
+            line += f", GTK3 parse {result['gtk3_parse_raw_ms']:.1f} ms -> {result['gtk3_parse_ms']:.1f} ms"
+        print(line)
+    print()
+
+    status = report(results, metrics, args.baseline, args.save_baseline, args.threshold)
+    return 1 if failed else status
+
+if(__name__ == "__main__"):
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# gtk4_css.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# The flattened GTK4 stylesheet against the plain one, for every bundled theme.
+# The run fails if any theme's resolved palette or rule cascade changes. It
+# reports size, and GTK4 parse time when PyGObject with GTK 4 is installed.
+#
+#   python -m benchmarks.gtk4_css
+
+import os, sys, time, argparse
+
+from benchmarks.common import themes_dir, baselines_dir, run_isolated, report
+from benchmarks.gtk3_css import cascade
+
+metrics = ["flat_kb", "flatten_ms", "gtk4_parse_ms"]
+
+# What ThemeApplier writes without the flatten option, minus the options box CSS
+def build(theme_type, theme, window_control):
+    with open(os.path.join(themes_dir, theme_type, theme), "r") as file:
+        css = file.read()
+    extras = ""
+    if(window_control != "default"):
+        with open(os.path.join(themes_dir, "window-controls", f"{window_control}.css"), "r") as file:
+            extras += file.read()
+    return css + "\n" + extras + "\n@define-color accent_bg_color #3584e4;\n@define-color accent_fg_color @window_bg_color;"
+
+def parse_gtk4(css, repeat):
+    import gi
+    gi.require_version("Gtk", "4.0")
+    from gi.repository import Gtk
+
+    errors = []
+    times = []
+    for _ in range(repeat):
+        provider = Gtk.CssProvider()
+        provider.connect("parsing-error", lambda provider, section, error: errors.append(error.message))
+        begin = time.perf_counter()
+        provider.load_from_data(css, -1)
+        times.append(time.perf_counter() - begin)
+    return {"ms": min(times) * 1000, "errors": len(errors) // repeat}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the flattened GTK4 stylesheet with the plain one")
+    parser.add_argument("--controls", nargs="+", default=["default", "colored", "macos"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--gtk", action="store_true", help="Also time parsing with GTK 4")
+    parser.add_argument("--baseline", default=os.path.join(baselines_dir, "gtk4_css.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    from src.css_optimizer import flatten_css, resolve_palette, parse
+
+    results = {}
+    failed = False
+    for theme_type in ["light", "dark"]:
+        for theme in sorted(os.listdir(os.path.join(themes_dir, theme_type))):
+            for window_control in args.controls:
+                name = f"{theme_type}/{theme}/{window_control}"
+                css = build(theme_type, theme, window_control)
+
+                times = []
+                for _ in range(args.repeat):
+                    begin = time.perf_counter()
+                    flat = flatten_css(css)
+                    times.append(time.perf_counter() - begin)
+
+                if(resolve_palette(parse(css)) != resolve_palette(parse(flat))):
+                    print(f"MISMATCH {name}: the resolved palette changed", file=sys.stderr)
+                    failed = True
+                if(cascade(css)[:2] != cascade(flat)[:2]):
+                    print(f"MISMATCH {name}: the rules resolve differently", file=sys.stderr)
+                    failed = True
+
+                results[name] = {
+                    "raw_kb": len(css.encode()) / 1024,
+                    "flat_kb": len(flat.encode()) / 1024,
+                    "flatten_ms": min(times) * 1000,
+                }
+                if(args.gtk):
+                    raw_parse = run_isolated(parse_gtk4, css, args.repeat)
+                    flat_parse = run_isolated(parse_gtk4, flat, args.repeat)
+                    if("error" not in raw_parse and "error" not in flat_parse):
+                        results[name]["gtk4_parse_raw_ms"] = raw_parse["ms"]
+                        results[name]["gtk4_parse_ms"] = flat_parse["ms"]
+                        if(raw_parse["errors"] != flat_parse["errors"]):
+                            print(f"MISMATCH {name}: {raw_parse['errors']} parse errors before, {flat_parse['errors']} after", file=sys.stderr)
+                            failed = True
+
+    raw = sum(result["raw_kb"] for result in results.values())
+    flat = sum(result["flat_kb"] for result in results.values())
+    print(f"{len(results)} stylesheets, {raw:.0f} KB -> {flat:.0f} KB, palettes {'differ' if failed else 'identical'}\n")
+
+    status = report(results, metrics, args.baseline, args.save_baseline, args.threshold)
+    return 1 if failed else status
+
+if(__name__ == "__main__"):
+    sys.exit(main())
@@ -0,0 +1,316 @@
+# image_pipeline.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Headless benchmark of the wallpaper tinting engine. No display is needed.
+#
+#   python -m benchmarks.image_pipeline --sizes 1080p 4k
+#   python -m benchmarks.image_pipeline --save-baseline
+#   python -m benchmarks.image_pipeline --stages worker_rss --sizes 4k
+#   python -m benchmarks.image_pipeline --stages remap_palette remap_monitor --monitor 1920x1080
+
+import os, sys, argparse, random, tempfile
+
+from benchmarks.common import run_isolated, measure, report, read_palette, read_rss_kb, baselines_dir
+
+sizes = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+kinds = ["photo", "flat"]
+quantizer_names = ["kmeans", "kmeans-lab", "median-cut", "octree"]
+encoder_names = ["jpeg", "jpeg-fast", "png", "png-fast", "webp", "webp-fast"]
+stages = ["compute_centroids", "simple_kmeans", "hamerly_kmeans", "kmeans_iterations", "image_to_lab", "remap_palette", "remap_monitor", "remap_palettes", "remap_batch", "preview", "remap_fitted", "retint", "worker_rss"] + [f"quantize:{name}" for name in quantizer_names] + [f"encode:{name}" for name in encoder_names]
+# These work on single colors, so they do not depend on the image size
+color_stages = ["rgb_to_lab", "deltaE2000", "ciede2000"]
+metrics = ["wall_ms", "rss_peak_mb", "tracemalloc_peak_mb", "mean_delta_e", "iteration_ms", "file_kb"]
+seed = 1234
+# What a tint run through run_in_worker may leave behind in the calling process
+worker_slack_mb = 16
+# Must never be imported by the process that starts the worker
+heavy_modules = ["numpy", "PIL"]
+palette = read_palette("dark", "Catppuccin Macchiato 🌺.css")
+batch_palettes = [read_palette("dark", theme) for theme in ["Catppuccin Macchiato 🌺.css", "Catppuccin Mocha 🌿.css", "Breeze Dark 🎐.css", "Bluetiful Dusk 🌃.css"]]
+
+def parse_size(name):
+    if(name in sizes):
+        return sizes[name]
+    width, height = name.lower().split("x")
+    return int(width), int(height)
+
+# Smooth low-frequency color fields with sensor-like noise on top
+def make_photo(width, height, rng):
+    from PIL import Image
+    import numpy as np
+
+    field = rng.integers(0, 256, size=(9, 16, 3), dtype=np.uint8)
+    base = np.asarray(Image.fromarray(field).resize((width, height), Image.BICUBIC), dtype=np.int16)
+    noise = rng.normal(0, 12, size=(height, width, 3)).astype(np.int16)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+# A handful of flat shapes in a limited palette, like vector wallpapers
+def make_flat(width, height, rng):
+    from PIL import Image, ImageDraw
+
+    shape_rng = random.Random(int(rng.integers(1 << 31)))
+    colors = [tuple(int(c) for c in rng.integers(0, 256, size=3)) for _ in range(12)]
+    img = Image.new("RGB", (width, height), colors[0])
+    draw = ImageDraw.Draw(img)
+    for _ in range(60):
+        x, y = shape_rng.randrange(width), shape_rng.randrange(height)
+        w, h = shape_rng.randrange(width // 20, width // 3), shape_rng.randrange(height // 20, height // 3)
+        color = shape_rng.choice(colors)
+        if(shape_rng.random() < 0.5):
+            draw.ellipse((x - w, y - h, x + w, y + h), fill=color)
+        else:
+            draw.polygon([(x, y), (x + w, y + h // 3), (x - w // 2, y + h)], fill=color)
+    return img
+
+def make_image(kind, size_name, directory):
+    import numpy as np
+
+    width, height = parse_size(size_name)
+    path = os.path.join(directory, f"{kind}-{width}x{height}.bmp")
+    if(not os.path.exists(path)):
+        # Seeded per case so every size and kind is reproducible on its own
+        rng = np.random.default_rng([seed, kinds.index(kind), width, height])
+        image = make_photo(width, height, rng) if kind == "photo" else make_flat(width, height, rng)
+        image.save(path) # BMP keeps the load step close to raw pixel reads
+    return path
+
+# Runs in a fresh process for each case
+def run_stage(stage, image_path, repeat, monitor=(1920, 1080)):
+    if(stage == "worker_rss"):
+        return compare_retained(image_path)
+
+    import numpy as np
+    from PIL import Image
+    from src import image_modifier
+
+    arr = np.array(Image.open(image_path).convert("RGB")).reshape(-1, 3)
+
+    def seeded(func):
+        def wrapper():
+            np.random.seed(seed)
+            return func()
+        return wrapper
+
+    if(stage == "compute_centroids"):
+        func = seeded(lambda: image_modifier.compute_centroids(arr, 8))
+    elif(stage == "simple_kmeans"):
+        func = seeded(lambda: image_modifier.simple_kmeans(arr, n_clusters=8))
+    elif(stage == "hamerly_kmeans"):
+        func = lambda: image_modifier.hamerly_kmeans(arr, n_clusters=8, seed=seed)
+    elif(stage == "kmeans_iterations"):
+        return compare_iterations(arr, repeat)
+    elif(stage == "image_to_lab"):
+        func = lambda: image_modifier.image_to_lab(arr)
+    elif(stage.startswith("quantize:")):
+        img = Image.open(image_path).convert("RGB")
+        quantizer = image_modifier.quantizers[stage.split(":", 1)[1]]
+        func = seeded(lambda: quantizer(img, arr, 8))
+    elif(stage == "remap_palette"):
+        # Includes decoding the file, as the app does
+        func = seeded(lambda: image_modifier.remap_palette(image_path, palette))
+    elif(stage == "remap_monitor"):
+        # The same, worked on at the size one monitor needs
+        func = seeded(lambda: image_modifier.remap_palette(image_path, palette, monitors=[monitor]))
+    elif(stage == "remap_palettes"):
+        # Four themes for one wallpaper, fitted once
+        func = seeded(lambda: image_modifier.remap_palettes(image_path, batch_palettes))
+    elif(stage == "remap_batch"):
+        # Four wallpapers already in memory, each with its own theme, on the thread pool
+        pixels = arr.reshape(*Image.open(image_path).size[::-1], 3)
+        func = lambda: image_modifier.remap_batch([pixels] * len(batch_palettes), batch_palettes)
+    elif(stage.startswith("encode:")):
+        # Saving the recolored image, the last step of every tint
+        fit = {}
+        img = image_modifier.remap_palette(image_path, palette, seed=seed, fit=fit)
+        colors = image_modifier.blend_palette(fit["centers"], palette)
+        output_base = os.path.join(os.path.dirname(image_path), "encoded")
+        encoder = stage.split(":", 1)[1]
+        func = lambda: image_modifier.save_tinted(img, fit["labels"], colors, output_base, encoder=encoder)
+    elif(stage == "preview"):
+        # What the dialog shows before anything is applied
+        func = lambda: image_modifier.fit_palette(image_modifier.load_preview(image_path))
+    elif(stage == "remap_fitted"):
+        # The full size render once a preview was applied, reusing its centers
+        labels, centers = image_modifier.fit_palette(image_modifier.load_preview(image_path))
+        func = lambda: image_modifier.remap_palette(image_path, palette, centers=centers)
+    elif(stage == "retint"):
+        # A theme change with "retint-wallpaper" on, from the stored fit to the saved JPEG
+        fit = {}
+        image_modifier.remap_palette(image_path, palette, seed=seed, fit=fit)
+        fit_path = os.path.join(os.path.dirname(image_path), "fit.npz")
+        image_modifier.save_fit(fit_path, fit)
+        del fit
+
+        def func():
+            fit = image_modifier.load_fit(fit_path)
+            colors = image_modifier.blend_palette(fit["centers"], palette, fit["blend"])
+            image_modifier.render_palette(fit["size"], fit["labels"], colors).save(os.path.join(os.path.dirname(image_path), "retint.jpg"))
+    else:
+        raise ValueError(f"Unknown stage {stage}")
+
+    result = measure(func, repeat)
+    result["pixels"] = len(arr)
+    if(stage.startswith("quantize:")):
+        result["mean_delta_e"] = mean_delta_e(arr, *func())
+    if(stage.startswith("encode:")):
+        result["file_kb"] = os.path.getsize(func()["background"]) / 1024
+    return result
+
+# Time per iteration of the plain and the bounded k-means, from the same seeding.
+# The first iteration of both includes a full assignment, so it is counted too.
+def compare_iterations(arr, repeat):
+    import numpy as np
+    from src import image_modifier
+
+    lloyd_ms = []
+    hamerly_ms = []
+    for _ in range(repeat):
+        lloyd = {}
+        hamerly = {}
+        image_modifier.simple_kmeans(arr, n_clusters=8, seed=seed, stats=lloyd)
+        image_modifier.hamerly_kmeans(arr, n_clusters=8, seed=seed, stats=hamerly)
+        lloyd_ms.append(np.mean(lloyd["iteration_ms"]))
+        hamerly_ms.append(np.mean(hamerly["iteration_ms"]))
+
+    return {
+        "pixels": len(arr),
+        "iteration_ms": min(hamerly_ms),
+        "lloyd_iteration_ms": min(lloyd_ms),
+        "speedup": min(lloyd_ms) / min(hamerly_ms),
+        "iterations": hamerly["iterations"],
+        "lloyd_iterations": lloyd["iterations"],
+        "skipped": float(np.mean(hamerly["skipped"])),
+    }
+
+# Resident memory left in this process after a tint, run once through a worker
+# process as the app does and once in-process. The baseline is read before
+# NumPy or Pillow are imported, and the worker must not import them here.
+def compare_retained(image_path):
+    import gc
+    from src.worker import run_in_worker
+
+    output_base = os.path.join(os.path.dirname(image_path), "worker")
+    fit_path = os.path.join(os.path.dirname(image_path), "worker-fit.npz")
+    baseline = read_rss_kb("VmRSS")
+    run_in_worker("src.image_modifier", "tint_file", image_path, output_base, palette, 1.0, "kmeans", None, fit_path)
+    run_in_worker("src.image_modifier", "retint_file", fit_path, os.path.dirname(image_path), palette)
+    worker = read_rss_kb("VmRSS")
+    imported = [name for name in heavy_modules if name in sys.modules]
+
+    from src import image_modifier
+    image_modifier.tint_file(image_path, output_base, palette, fit_path=fit_path)
+    image_modifier.retint_file(fit_path, os.path.dirname(image_path), palette)
+    gc.collect()
+    inline = read_rss_kb("VmRSS")
+
+    return {
+        "baseline_rss_mb": baseline / 1024,
+        "worker_retained_mb": (worker - baseline) / 1024,
+        "inline_retained_mb": (inline - baseline) / 1024,
+        "imported": imported,
+    }
+
+# How far, on average, each pixel is from the color of its cluster (CIEDE2000, on a fixed sample)
+def mean_delta_e(arr, labels, centers, samples=200000):
+    import numpy as np
+    from src import image_modifier
+
+    rng = np.random.default_rng(seed)
+    index = rng.choice(len(arr), size=min(samples, len(arr)), replace=False)
+    original = image_modifier.rgb_to_lab(arr[index].T)
+    quantized = image_modifier.rgb_to_lab(np.asarray(centers)[labels[index]].T)
+    return float(np.mean(image_modifier.deltaE2000(original, quantized)))
+
+# Each sample color is compared against the whole theme palette. ciede2000 is the
+# plain Python accent matcher in colors.py that runs on every apply.
+def run_color_stage(stage, count, repeat):
+    from src import image_modifier
+    from src.colors import ciede2000
+
+    rng = random.Random(seed)
+    samples = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(count)]
+
+    if(stage == "rgb_to_lab"):
+        func = lambda: [image_modifier.rgb_to_lab(rgb) for rgb in samples]
+    elif(stage == "deltaE2000"):
+        labs = [image_modifier.rgb_to_lab(rgb) for rgb in samples]
+        targets = [image_modifier.rgb_to_lab(image_modifier.hex_to_rgb(color)) for color in palette]
+        func = lambda: [image_modifier.deltaE2000(lab, target) for lab in labs for target in targets]
+    elif(stage == "ciede2000"):
+        func = lambda: [ciede2000(rgb, palette) for rgb in samples]
+    else:
+        raise ValueError(f"Unknown stage {stage}")
+    return measure(func, repeat)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the wallpaper tinting engine")
+    parser.add_argument("--sizes", nargs="+", default=list(sizes), help="1080p, 1440p, 4k, 8k or WIDTHxHEIGHT")
+    parser.add_argument("--kinds", nargs="+", default=kinds, choices=kinds)
+    parser.add_argument("--stages", nargs="+", default=stages + color_stages, choices=stages + color_stages)
+    parser.add_argument("--monitor", default="1920x1080", help="WIDTHxHEIGHT of the monitor for remap_monitor")
+    parser.add_argument("--colors", type=int, default=200, help="Sample colors for the color stages")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=os.path.join(baselines_dir, "image_pipeline.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before failing, 0.15 = 15%%")
+    args = parser.parse_args(argv)
+
+    results = {}
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="rewaita-bench-") as directory:
+        for stage in args.stages:
+            if(stage in color_stages):
+                results[f"{stage}/{args.colors} colors"] = run_isolated(run_color_stage, stage, args.colors, args.repeat)
+
+        for size in args.sizes:
+            for kind in args.kinds:
+                image_path = make_image(kind, size, directory)
+                for stage in args.stages:
+                    if(stage in color_stages):
+                        continue
+                    name = f"{stage}/{kind}/{size}"
+                    print(f"Running {name}...", file=sys.stderr)
+                    results[name] = run_isolated(run_stage, stage, image_path, args.repeat, parse_size(args.monitor))
+
+    for name, result in results.items():
+        if(name.startswith("kmeans_iterations/") and "error" not in result):
+            print(f"{name}: {result['lloyd_iteration_ms']:.1f} ms -> {result['iteration_ms']:.1f} ms per iteration "
+                  f"({result['speedup']:.2f}x), {result['iterations']} iterations against {result['lloyd_iterations']}, "
+                  f"{result['skipped'] * 100:.0f}% of points skipped")
+        if(name.startswith("worker_rss/") and "error" not in result):
+            print(f"{name}: {result['worker_retained_mb']:.1f} MB kept after the worker, "
+                  f"{result['inline_retained_mb']:.1f} MB after the same tint in-process")
+            if(result["imported"]):
+                print(f"LEAK {name}: running the worker imported {', '.join(result['imported'])}", file=sys.stderr)
+                failed = True
+            if(result["worker_retained_mb"] > worker_slack_mb):
+                print(f"LEAK {name}: the worker left {result['worker_retained_mb']:.1f} MB behind", file=sys.stderr)
+                failed = True
+    print()
+
+    status = report(results, metrics, args.baseline, args.save_baseline, args.threshold)
+    return 1 if failed else status
+
+if(__name__ == "__main__"):
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# startup_scaling.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# How window startup scales with the number of installed themes. The light and
+# dark data dirs are filled with N generated themes each, then the real
+# application is started in a fresh process until its first frame is painted.
+# Every N is run twice, once with a cold thumbnail cache and once warm.
+# --background also starts the service the way the autostart entry does, and
+# reports its resident memory next to the window's.
+#
+# This needs a display. On a machine without one, run it under a virtual display:
+#   xvfb-run -a python -m benchmarks.startup_scaling
+#   python -m benchmarks.startup_scaling --counts 10 100 --save
+#   xvfb-run -a python -m benchmarks.startup_scaling --counts 100 --background
+#
+# Saved results go to benchmarks/results/startup_scaling/<version>.json, so a
+# later run on the same machine can be compared with --compare <version>.
+
+import os, re, sys, time, random, argparse, subprocess, tempfile
+
+from benchmarks.common import root_dir, themes_dir, stage_package, run_isolated, read_rss_kb, peak_rss_kb, report
+
+results_dir = os.path.join(root_dir, "benchmarks", "results", "startup_scaling")
+metrics = ["window_ms", "first_frame_ms", "ready_ms", "rss_mb", "rss_peak_mb"]
+seed = 1234
+
+def read_version():
+    with open(os.path.join(root_dir, "meson.build"), "r") as file:
+        return re.search(r"version:\s*'([^']+)'", file.read()).group(1)
+
+# Copies of the bundled themes with every color shuffled, so no two thumbnails are alike
+def generate_themes(data_dir, count):
+    rng = random.Random(seed)
+    for theme_type in ["light", "dark"]:
+        templates = []
+        for name in sorted(os.listdir(os.path.join(themes_dir, theme_type))):
+            with open(os.path.join(themes_dir, theme_type, name), "r") as file:
+                templates.append(file.read())
+
+        out = os.path.join(data_dir, theme_type)
+        os.makedirs(out, exist_ok=True)
+        for index in range(count):
+            css = re.sub(r"#[0-9a-fA-F]{6}\b", lambda match: f"#{rng.randrange(1 << 24):06x}", templates[index % len(templates)])
+            with open(os.path.join(out, f"Synthetic {index:05d}.css"), "w") as file:
+                file.write(css)
+
+def compile_resources(directory):
+    target = os.path.join(directory, "rewaita.gresource")
+    subprocess.run([
+        "glib-compile-resources",
+        "--sourcedir", os.path.join(root_dir, "src"),
+        "--target", target,
+        os.path.join(root_dir, "src", "rewaita.gresource.xml"),
+    ], check=True)
+    return target
+
+# The same environment for every run, returns the application and when it started
+def start_app(home, bus_address, source_dir, resource_path):
+    os.environ.update({
+        "HOME": home,
+        "XDG_CONFIG_HOME": os.path.join(home, ".config"),
+        "XDG_DATA_HOME": os.path.join(home, ".local", "share"),
+        "XDG_CACHE_HOME": os.path.join(home, ".cache"),
+        "GSETTINGS_BACKEND": "memory",
+        "GSETTINGS_SCHEMA_DIR": os.path.join(root_dir, "data"),
+        "DBUS_SESSION_BUS_ADDRESS": bus_address,
+    })
+    import gettext
+    gettext.install("rewaita")
+
+    begin = time.perf_counter()
+    sys.path.insert(0, source_dir)
+    from gi.repository import Gio, GLib
+    Gio.Resource.load(resource_path)._register()
+    from rewaita import main, tracing
+
+    tracing.enable(os.devnull)
+    return main.RewaitaApplication(), begin
+
+def collect_spans(result):
+    from rewaita import tracing
+
+    for event in tracing.events:
+        key = f"{event['name'].replace(' ', '_')}_ms"
+        result[key] = result.get(key, 0) + event["dur"] / 1000
+    result["loaded_themes"] = sum(1 for event in tracing.events if event["name"] == "load_colors_from_css")
+    return result
+
+# Runs in a fresh process, so imports, caches and memory start from nothing
+def run_startup(home, bus_address, source_dir, resource_path):
+    from gi.repository import GLib
+
+    app, begin = start_app(home, bus_address, source_dir, resource_path)
+    result = {}
+
+    def on_after_paint(clock):
+        if(result):
+            return
+        result["first_frame_ms"] = (time.perf_counter() - begin) * 1000
+        result["rss_mb"] = read_rss_kb("VmRSS") / 1024
+        result["rss_peak_mb"] = peak_rss_kb() / 1024
+        # Lets the thumbnail cache save its index first, so the next run starts warm
+        GLib.idle_add(app.quit, priority=GLib.PRIORITY_LOW)
+
+    def on_window_added(app, window):
+        window.connect("realize", lambda widget: widget.get_frame_clock().connect("after-paint", on_after_paint))
+
+    def on_startup(app):
+        # The background portal is not part of the fake session
+        app.app_settings.set_boolean("run-in-background", False)
+
+    app.connect("window-added", on_window_added)
+    app.connect("startup", on_startup)
+    app.run([])
+    return collect_spans(result)
+
+# `rewaita --background`, measured once the command line has been handled and
+# the main loop has nothing left to do
+def run_background(home, bus_address, source_dir, resource_path):
+    from gi.repository import GLib
+
+    app, begin = start_app(home, bus_address, source_dir, resource_path)
+    result = {}
+
+    def on_ready():
+        result["ready_ms"] = (time.perf_counter() - begin) * 1000
+        result["rss_mb"] = read_rss_kb("VmRSS") / 1024
+        result["rss_peak_mb"] = peak_rss_kb() / 1024
+        result["window_built"] = app.props.active_window is not None
+        app.quit()
+
+    app.connect("startup", lambda app: GLib.idle_add(on_ready, priority=GLib.PRIORITY_LOW))
+    app.run(["rewaita", "--background"])
+    return collect_spans(result)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure window startup against the number of installed themes")
+    parser.add_argument("--counts", nargs="+", type=int, default=[10, 100, 1000, 5000], help="Generated themes per light and dark")
+    parser.add_argument("--save", action="store_true", help="Save the results for the current version")
+    parser.add_argument("--compare", default=None, help="Version to compare against, defaults to the current one")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    parser.add_argument("--background", action="store_true", help="Also measure the --background service")
+    args = parser.parse_args(argv)
+
+    if(not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))):
+        print("No display found, run this under xvfb-run or a headless compositor", file=sys.stderr)
+        return 2
+
+    from benchmarks import fake_session
+    bus_address = fake_session.start()
+
+    source_dir = tempfile.mkdtemp(prefix="rewaita-src-")
+    stage_package(source_dir)
+    resource_path = compile_resources(source_dir)
+
+    results = {}
+    for count in args.counts:
+        home = tempfile.mkdtemp(prefix="rewaita-home-")
+        generate_themes(os.path.join(home, ".local", "share"), count)
+        for cache in ["cold", "warm"]:
+            print(f"Starting with {count} themes, {cache} cache...", file=sys.stderr)
+            results[f"{count} themes/{cache}"] = run_isolated(run_startup, home, bus_address, source_dir, resource_path)
+        if(args.background):
+            print(f"Starting the background service with {count} themes...", file=sys.stderr)
+            results[f"{count} themes/background"] = run_isolated(run_background, home, bus_address, source_dir, resource_path)
+
+    for count in args.counts:
+        window = results[f"{count} themes/warm"]
+        background = results.get(f"{count} themes/background")
+        if(background and "error" not in background and "error" not in window):
+            print(f"{count} themes: background {background['ready_ms']:.0f} ms, {background['rss_mb']:.1f} MB resident"
+                  f"{' (built a window!)' if background['window_built'] else ''}, "
+                  f"window {window['first_frame_ms']:.0f} ms, {window['rss_mb']:.1f} MB")
+
+    version = read_version()
+    if(args.save):
+        return report(results, metrics, os.path.join(results_dir, f"{version}.json"), True, args.threshold)
+    return report(results, metrics, os.path.join(results_dir, f"{args.compare or version}.json"), False, args.threshold)
+
+if(__name__ == "__main__"):
+    sys.exit(main())
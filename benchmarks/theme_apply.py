@@ -0,0 +1,172 @@
+# theme_apply.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# End-to-end benchmark of applying themes, the path behind on_theme_selected and
+# set_to_default. Every bundled theme is applied with every combination of
+# options inside a throwaway HOME. The portal and GNOME Shell are faked on a
+# private session bus (see fake_session.py), so no desktop is needed, only
+# dbus-daemon, PyGObject, GTK 4, libadwaita and libportal.
+#
+#   python -m benchmarks.theme_apply
+#   python -m benchmarks.theme_apply --themes "Nord ❄️.css" --controls default
+
+import os, sys, json, time, gettext, argparse, itertools, tempfile
+
+from benchmarks.common import root_dir, themes_dir, baselines_dir, stage_package, read_proc_io, percentile, report
+
+boolean_options = ["modify-gtk3-theme", "modify-gnome-shell", "transparency", "window", "sharp"]
+metrics = ["median_ms", "p95_ms", "max_ms", "bytes"]
+
+def make_home():
+    home = tempfile.mkdtemp(prefix="rewaita-home-")
+    # GLib reads these once, so they have to be in place before anything asks for them
+    os.environ.update({
+        "HOME": home,
+        "XDG_CONFIG_HOME": os.path.join(home, ".config"),
+        "XDG_DATA_HOME": os.path.join(home, ".local", "share"),
+        "XDG_CACHE_HOME": os.path.join(home, ".cache"),
+        "XDG_CURRENT_DESKTOP": "GNOME",
+        "GSETTINGS_BACKEND": "memory",
+        "GSETTINGS_SCHEMA_DIR": os.path.join(root_dir, "data"),
+    })
+    return home
+
+def options_label(values, window_control):
+    enabled = [name for name, value in zip(boolean_options, values) if value]
+    return "+".join(enabled + [f"controls={window_control}"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark applying every bundled theme with every option combination")
+    parser.add_argument("--themes", nargs="+", help="Theme file names, defaults to every bundled theme")
+    parser.add_argument("--controls", nargs="+", help="Window controls, defaults to default plus every bundled style")
+    parser.add_argument("--by-options", action="store_true", help="Also report each option combination on its own")
+    parser.add_argument("--output", help="Write every individual apply to this JSON file")
+    parser.add_argument("--baseline", default=os.path.join(baselines_dir, "theme_apply.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    home = make_home()
+    gettext.install("rewaita")
+
+    from benchmarks import fake_session
+    fake_session.start()
+
+    import gi
+    gi.require_version('Gtk', '4.0')
+    gi.require_version('Adw', '1')
+    gi.require_version('Xdp', '1.0')
+    from gi.repository import Gio, GLib
+
+    module_dir = stage_package(tempfile.mkdtemp(prefix="rewaita-src-"))
+    from rewaita import tracing
+    from rewaita.applier import ThemeApplier
+    from rewaita.utils import sync_bundled_themes
+
+    tracing.enable(os.devnull)
+    data_dir = GLib.get_user_data_dir()
+    app_settings = Gio.Settings.new("io.github.swordpuffin.rewaita")
+    applier = ThemeApplier(app_settings)
+
+    controls = args.controls or ["default"] + sorted(name[:-4] for name in os.listdir(os.path.join(module_dir, "window-controls")))
+    context = GLib.MainContext.default()
+
+    # reset_shell is asynchronous, an apply is only finished once the extension is back on
+    def wait_for_shell():
+        deadline = time.perf_counter() + 5
+        while(not any(event["name"] == "reset_shell" for event in tracing.events)):
+            if(not context.iteration(False)):
+                time.sleep(0.0002)
+            if(time.perf_counter() > deadline):
+                raise RuntimeError("Timed out waiting for the shell reset")
+
+    records = []
+    for theme_type in ["light", "dark"]:
+        sync_bundled_themes(os.path.join(module_dir, theme_type), os.path.join(data_dir, theme_type))
+        fake_session.call_control("SetColorScheme", GLib.Variant("(u)", (1 if theme_type == "dark" else 0,)))
+        themes = args.themes or sorted(os.listdir(os.path.join(themes_dir, theme_type)))
+
+        for theme in ["default"] + [name for name in themes if os.path.exists(os.path.join(data_dir, theme_type, name))]:
+            print(f"Applying {theme_type}/{theme}...", file=sys.stderr)
+            app_settings.set_string(f"{theme_type}-theme", theme)
+
+            for values in itertools.product([False, True], repeat=len(boolean_options)):
+                for window_control in controls:
+                    for name, value in zip(boolean_options, values):
+                        app_settings.set_boolean(name, value)
+                    app_settings.set_string("window-controls", window_control)
+
+                    resets_shell = theme == "default" or app_settings.get_boolean("modify-gnome-shell")
+                    tracing.events.clear()
+                    written = read_proc_io("wchar")
+                    begin = time.perf_counter()
+
+                    applier.apply()
+                    if(resets_shell):
+                        wait_for_shell()
+
+                    total = (time.perf_counter() - begin) * 1000
+                    stages = {}
+                    for event in tracing.events:
+                        stages[event["name"]] = stages.get(event["name"], 0) + event["dur"] / 1000
+                    stages["total"] = total
+
+                    records.append({
+                        "theme_type": theme_type,
+                        "theme": theme,
+                        "options": options_label(values, window_control),
+                        "stages": stages,
+                        "bytes": read_proc_io("wchar") - written,
+                    })
+
+    if(args.output):
+        with open(args.output, "w") as file:
+            json.dump(records, file, indent=2)
+
+    # Default themes go through set_to_default, so they are reported apart from the rest
+    groups = {}
+    for record in records:
+        kind = "default" if record["theme"] == "default" else "theme"
+        keys = [kind]
+        if(args.by_options):
+            keys.append(f"{kind}/{record['options']}")
+        for key in keys:
+            for stage, duration in record["stages"].items():
+                group = groups.setdefault(f"{stage}/{key}", {"times": [], "bytes": []})
+                group["times"].append(duration)
+                if(stage == "total"):
+                    group["bytes"].append(record["bytes"])
+
+    results = {}
+    for name, group in sorted(groups.items()):
+        results[name] = {
+            "count": len(group["times"]),
+            "median_ms": percentile(group["times"], 0.5),
+            "p95_ms": percentile(group["times"], 0.95),
+            "max_ms": max(group["times"]),
+        }
+        if(group["bytes"]):
+            results[name]["bytes"] = sum(group["bytes"]) / len(group["bytes"])
+
+    shell_calls = fake_session.call_control("GetShellCalls", None, "(u)")[0]
+    print(f"\n{len(records)} applies in {home}, {shell_calls // 2} shell resets")
+    return report(results, metrics, args.baseline, args.save_baseline, args.threshold)
+
+if(__name__ == "__main__"):
+    sys.exit(main())
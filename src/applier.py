@@ -0,0 +1,237 @@
+# applier.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os, shutil, re, hashlib
+from gi.repository import Gio, GLib
+from collections import defaultdict
+from .css_optimizer import flatten_css, optimize_css
+from . import css_optimizer
+from .utils import parse_gtk_theme, set_to_default, set_gtk3_theme, get_accent_color, read_accent_color, get_portal_settings
+from .extra_options_box import transparency_css, border_css, sharp_corners_css
+from .wallpaper import retint_wallpaper
+from .tracing import span, now, record
+
+user_theme_extension = "user-theme@gnome-shell-extensions.gcampax.github.com"
+proxy = None
+
+# The shell proxy is created on first use and every call is asynchronous, so
+# neither importing this module nor applying a theme waits on the session bus
+def reset_shell():
+    app = Gio.Application.get_default()
+    if(app):
+        app.hold() # Keeps a one-shot run alive until the extension is back on
+    begin = now()
+
+    def release():
+        record("reset_shell", begin)
+        if(app):
+            app.release()
+
+    def call(method):
+        proxy.call(method, GLib.Variant("(s)", (user_theme_extension,)), Gio.DBusCallFlags.NONE, -1, None, on_call_done, method)
+
+    def on_call_done(source, result, method):
+        try:
+            source.call_finish(result)
+        except GLib.Error as e:
+            print(f"Error resetting shell theme: {e.message}")
+        if(method == "DisableExtension"):
+            call("EnableExtension")
+        else:
+            release()
+
+    def on_proxy_ready(source, result):
+        global proxy
+        try:
+            proxy = Gio.DBusProxy.new_for_bus_finish(result)
+        except GLib.Error as e:
+            print(f"Error connecting to GNOME Shell: {e.message}")
+            release()
+            return
+        call("DisableExtension")
+
+    if(proxy is None):
+        Gio.DBusProxy.new_for_bus(
+            Gio.BusType.SESSION,
+            Gio.DBusProxyFlags.DO_NOT_LOAD_PROPERTIES | Gio.DBusProxyFlags.DO_NOT_CONNECT_SIGNALS,
+            None,
+            'org.gnome.Shell.Extensions',
+            '/org/gnome/Shell/Extensions',
+            'org.gnome.Shell.Extensions',
+            None,
+            on_proxy_ready
+        )
+    else:
+        call("DisableExtension")
+
+gtk3_config_dir = os.path.join(os.path.expanduser("~/.config"), "gtk-3.0")
+gtk4_config_dir = os.path.join(os.path.expanduser("~/.config"), "gtk-4.0")
+gnome_shell_dir = os.path.join(GLib.getenv("HOME"), ".local", "share", "themes")
+
+# Settings key for each toggle in the options box
+extra_options = {
+    "transparency": transparency_css,
+    "window": border_css,
+    "sharp": sharp_corners_css,
+}
+
+templates = {}
+gtk3_templates = {}
+gtk3_cache_dir = os.path.join(GLib.get_user_cache_dir(), "rewaita", "gtk3")
+
+# Templates are read on first use instead of at import, and only when the matching option is enabled
+def read_template(*path):
+    if(path not in templates):
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), *path)) as file:
+            templates[path] = file.read()
+    return templates[path]
+
+# Writes the themes without any widgets. Preferences are read back from GSettings
+# on every apply, so the window and the background service always agree.
+class ThemeApplier:
+    def __init__(self, app_settings):
+        self.app_settings = app_settings
+        self.data_dir = GLib.get_user_data_dir()
+
+        #Makes necessary directories
+        for path in [gtk3_config_dir, gtk4_config_dir, gnome_shell_dir]:
+            os.makedirs(path, exist_ok=True)
+
+    def get_theme_type(self):
+        if(get_portal_settings().read_uint("org.freedesktop.appearance", "color-scheme") == 1):
+            return "dark"
+        return "light"
+
+    def get_extras(self, window_control):
+        extras = ""
+        if(window_control != "default"):
+            extras += open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "window-controls", f"{window_control}.css")).read()
+        for key, css in extra_options.items():
+            if(self.app_settings.get_boolean(key)):
+                extras += css
+        return extras
+
+    # The window-control rules go in before rendering, so the optimizer can drop the titlebutton rules they replace
+    # Optimized before the colors go in, once for each window control and
+    # transparency. The result is kept in memory and in the cache folder, under
+    # a hash of the template and the optimizer, so an apply only fills in colors.
+    def get_gtk3_template(self, window_control, transparency):
+        key = (window_control, transparency)
+        if(key in gtk3_templates):
+            return gtk3_templates[key]
+
+        template = read_template("gtk3-template", "gtk.css")
+        if(window_control != "default"):
+            template += "\n" + read_template("gtk3-template", "window-controls", f"{window_control}.css")
+        if(transparency):
+            template += ".background:not(.nautilus-desktop) { opacity: 0.95; }"
+
+        digest = hashlib.sha1(template.encode())
+        digest.update(str(os.path.getmtime(css_optimizer.__file__)).encode())
+        cache_path = os.path.join(gtk3_cache_dir, f"{digest.hexdigest()}.css")
+        if(os.path.exists(cache_path)):
+            with open(cache_path, "r") as file:
+                gtk3_templates[key] = file.read()
+            return gtk3_templates[key]
+
+        with span("gtk3 optimize"):
+            gtk3_templates[key] = optimize_css(template)
+        os.makedirs(gtk3_cache_dir, exist_ok=True)
+        with open(cache_path, "w") as file:
+            file.write(gtk3_templates[key])
+        return gtk3_templates[key]
+
+    # Returns the stylesheet and accent color for the app's own css provider
+    def apply(self):
+        with span("apply"):
+            return self.apply_theme()
+
+    def apply_theme(self):
+        theme_type = self.get_theme_type()
+        theme_name = self.app_settings.get_string(f"{theme_type}-theme")
+        window_control = self.app_settings.get_string("window-controls")
+        modify_gtk3_theme = self.app_settings.get_boolean("modify-gtk3-theme")
+        modify_gnome_shell = self.app_settings.get_boolean("modify-gnome-shell")
+        extras = self.get_extras(window_control)
+
+        if(theme_name.lower() == "default"):
+            with span("set_to_default"):
+                set_to_default([gtk3_config_dir, gtk4_config_dir], reset_shell, extras)
+            gtk_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"default-{theme_type}.css")
+            return open(gtk_file).read() + extras, f"rgb{read_accent_color()}"
+
+        theme_file = os.path.join(self.data_dir, theme_type, theme_name)
+        gtk_css = open(theme_file).read()
+
+        with span("parse"):
+            color_pattern = r'@define-color\s+([a-z0-9_]+)\s+(#[a-fA-F0-9]+|@[a-z0-9_]+);'
+            references = defaultdict(list)
+            colors = dict()
+
+            for match in re.finditer(color_pattern, gtk_css):
+                name, value = match.groups()
+                if(value.startswith('@')):
+                    ref_name = value[1:]
+                    references[ref_name].append(name)
+                else:
+                    colors[name] = value
+
+            for ref_name, dependent_names in references.items():
+                if(ref_name in colors):
+                    for name in dependent_names:
+                        colors[name] = colors[ref_name]
+
+        palette = list(colors.values())
+        with span("accent match"):
+            accent_color = get_accent_color(palette)
+        colors["accent_color"] = accent_color
+        extras = "\n" + extras + f"\n@define-color accent_bg_color {accent_color};\n@define-color accent_fg_color @window_bg_color;"
+
+        with span("gtk4 write"):
+            try:
+                if(self.app_settings.get_boolean("flatten-gtk4-theme")):
+                    with open(os.path.join(gtk4_config_dir, "gtk.css"), "w") as file:
+                        file.write(flatten_css(gtk_css + extras))
+                else:
+                    shutil.copy(theme_file, os.path.join(gtk4_config_dir, "gtk.css"))
+                    with open(os.path.join(gtk4_config_dir, "gtk.css"), "a") as file:
+                        file.write(extras)
+            except Exception as e:
+                print(f"Error moving file: {e}")
+
+        parse_gtk_theme(
+            colors,
+            read_template("gnome-shell-template.css") if modify_gnome_shell else "",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "gnome-shell-template.css"),
+            self.get_gtk3_template(window_control, self.app_settings.get_boolean("transparency")) if modify_gtk3_theme else "",
+            modify_gtk3_theme,
+            modify_gnome_shell,
+            self.app_settings,
+            reset_shell
+        )
+
+        if(modify_gtk3_theme):
+            with span("assets extract"):
+                set_gtk3_theme(gtk3_config_dir)
+
+        # Runs in a thread, the theme does not wait for the wallpaper
+        if(self.app_settings.get_boolean("retint-wallpaper")):
+            retint_wallpaper(palette, theme_name)
+
+        return gtk_css + extras, accent_color
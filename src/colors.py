@@ -0,0 +1,118 @@
+# colors.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Plain Python color math for matching a single accent color. Kept free of
+# NumPy and Pillow so that it can run on the startup path.
+
+import math
+
+def hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+def rgb_to_xyz(rgb):
+    r, g, b = (c / 255.0 for c in rgb)
+    r, g, b = (((c + 0.055) / 1.055) ** 2.4 if c > 0.04045 else c / 12.92 for c in (r, g, b))
+
+    return (
+        (0.4124564 * r + 0.3575761 * g + 0.1804375 * b) * 100,
+        (0.2126729 * r + 0.7151522 * g + 0.0721750 * b) * 100,
+        (0.0193339 * r + 0.1191920 * g + 0.9503041 * b) * 100,
+    )
+
+def xyz_to_lab(xyz):
+    def f(t):
+        return t ** (1/3) if t > 0.008856 else 7.787 * t + 16/116
+
+    fx, fy, fz = (f(value / ref) for value, ref in zip(xyz, (95.047, 100.0, 108.883)))
+
+    L = 116 * fy - 16
+    a = 500 * (fx - fy)
+    b = 200 * (fy - fz)
+
+    return (L, a, b)
+
+def rgb_to_lab(rgb):
+    return xyz_to_lab(rgb_to_xyz(rgb))
+
+def deltaE2000(lab1, lab2):
+    L1, a1, b1 = lab1
+    L2, a2, b2 = lab2
+
+    avg_L = (L1 + L2) / 2.0
+    C1 = math.sqrt(a1*a1 + b1*b1)
+    C2 = math.sqrt(a2*a2 + b2*b2)
+    avg_C = (C1 + C2) / 2.0
+
+    G = 0.5 * (1 - math.sqrt((avg_C**7) / (avg_C**7 + 25**7)))
+    a1p = (1 + G) * a1
+    a2p = (1 + G) * a2
+
+    C1p = math.sqrt(a1p*a1p + b1*b1)
+    C2p = math.sqrt(a2p*a2p + b2*b2)
+
+    avg_Cp = (C1p + C2p) / 2.0
+
+    h1p = math.degrees(math.atan2(b1, a1p)) % 360
+    h2p = math.degrees(math.atan2(b2, a2p)) % 360
+
+    dhp = h2p - h1p
+    if(dhp > 180):
+        dhp -= 360
+    elif(dhp < -180):
+        dhp += 360
+
+    if(abs(h1p - h2p) > 180):
+        avg_hp = (h1p + h2p + 360) / 2
+    else:
+        avg_hp = (h1p + h2p) / 2
+
+    T = (
+        1
+        - 0.17 * math.cos(math.radians(avg_hp - 30))
+        + 0.24 * math.cos(math.radians(2 * avg_hp))
+        + 0.32 * math.cos(math.radians(3 * avg_hp + 6))
+        - 0.20 * math.cos(math.radians(4 * avg_hp - 63))
+    )
+
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    dHp = 2 * math.sqrt(C1p * C2p) * math.sin(math.radians(dhp / 2))
+
+    S_L = 1 + (0.015 * (avg_L - 50)**2) / math.sqrt(20 + (avg_L - 50)**2)
+    S_C = 1 + 0.045 * avg_Cp
+    S_H = 1 + 0.015 * avg_Cp * T
+
+    Rt = -2 * math.sqrt((avg_Cp**7) / (avg_Cp**7 + 25**7))
+    Rt *= math.sin(math.radians(60 * math.exp(-(((avg_hp - 275) / 25) ** 2))))
+
+    dE = math.sqrt(
+        (dLp / S_L)**2 +
+        (dCp / S_C)**2 +
+        (dHp / S_H)**2 +
+        Rt * (dCp / S_C) * (dHp / S_H)
+    )
+    return dE
+
+def ciede2000(rgb, palette):
+    palette = list(palette)
+    lab_input = rgb_to_lab(rgb)
+
+    diffs = [deltaE2000(lab_input, rgb_to_lab(hex_to_rgb(color))) for color in palette]
+    return palette[diffs.index(min(diffs))]
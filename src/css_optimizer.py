@@ -0,0 +1,278 @@
+# css_optimizer.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Shrinks the stylesheets we write so every app that starts has less to parse.
+#
+# Comments and whitespace are removed. A declaration is dropped when a later rule
+# with the exact same selector sets the same property to a value GTK understands,
+# since that rule always wins (this is how the window-control and transparency
+# rules replace the template's). Adjacent rules with the same selector or the same declarations
+# are merged. @define-color keeps only its last definition, because GTK looks
+# colors up after the whole file is parsed. Other at-rule blocks (@keyframes,
+# @media) are only minified, never looked into.
+
+import re
+
+token_pattern = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/|\s+|[{};]|[^"\'/{};\s]+|/', re.S)
+string_pattern = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+important_pattern = re.compile(r'\s*!\s*important$', re.I)
+reference_pattern = re.compile(r'@([a-zA-Z0-9_-]+)')
+function_pattern = re.compile(r'([a-zA-Z_-][a-zA-Z0-9_-]*)\(')
+# Functions GTK 3 and 4 parse. A value with any other function may be dropped
+# by GTK, and then an earlier declaration of the property is what applies.
+known_functions = {
+    "rgb", "rgba", "hsl", "hsla", "alpha", "shade", "mix", "lighter", "darker", "color-mix", "color",
+    "oklab", "oklch", "hwb", "linear-gradient", "radial-gradient", "repeating-linear-gradient",
+    "repeating-radial-gradient", "cross-fade", "image", "url", "calc", "min", "max", "clamp", "var",
+    "cubic-bezier", "steps", "translate", "translatex", "translatey", "scale", "rotate", "matrix",
+    "-gtk-icontheme", "-gtk-scaled", "-gtk-recolor", "-gtk-gradient", "-gtk-win32-theme-part",
+    "drop-shadow", "blur", "opacity", "brightness", "contrast", "grayscale", "saturate", "sepia",
+    "invert", "hue-rotate",
+}
+
+def tokenize(css):
+    tokens = []
+    for match in token_pattern.finditer(css):
+        token = match.group()
+        if(token.startswith("/*") or token.isspace()):
+            if(tokens and tokens[-1] != " "):
+                tokens.append(" ")
+        else:
+            tokens.append(token)
+    return tokens
+
+def outside_strings(text, func):
+    parts = string_pattern.split(text)
+    return "".join(part if index % 2 else func(part) for index, part in enumerate(parts))
+
+def minify_value(value):
+    return outside_strings(value.strip(), lambda part: re.sub(r'\(\s+', '(', re.sub(r'\s+\)', ')', re.sub(r'\s*,\s*', ',', part))))
+
+def minify_selector(selector):
+    return outside_strings(selector.strip(), lambda part: re.sub(r'\s*([,>+~])\s*', r'\1', part))
+
+def minify_block(tokens):
+    text = "".join(tokens).strip()
+    return outside_strings(text, lambda part: re.sub(r'\s*([{};])\s*', r'\1', part))
+
+# Commas inside :not(), [attr] or quotes do not separate selectors
+def split_selectors(text):
+    selectors = []
+    depth = 0
+    quote = None
+    start = 0
+    index = 0
+    while(index < len(text)):
+        char = text[index]
+        if(quote):
+            if(char == "\\"):
+                index += 1
+            elif(char == quote):
+                quote = None
+        elif(char in "\"'"):
+            quote = char
+        elif(char in "(["):
+            depth += 1
+        elif(char in ")]"):
+            depth -= 1
+        elif(char == "," and depth == 0):
+            selectors.append(minify_selector(text[start:index]))
+            start = index + 1
+        index += 1
+    selectors.append(minify_selector(text[start:]))
+    return selectors
+
+def parse_declarations(tokens):
+    declarations = []
+    current = []
+    for token in tokens + [";"]:
+        if(token != ";"):
+            current.append(token)
+            continue
+        text = "".join(current).strip()
+        current = []
+        if(":" not in text):
+            continue
+        name, value = text.split(":", 1)
+        important = bool(important_pattern.search(value))
+        declarations.append((name.strip().lower(), minify_value(important_pattern.sub("", value)), important))
+    return declarations
+
+# Splits the sheet into ("statement", text), ("block", prelude, body) and ("rule", selectors, declarations)
+def parse(css):
+    tokens = tokenize(css)
+    items = []
+    prelude = []
+    index = 0
+    while(index < len(tokens)):
+        token = tokens[index]
+        index += 1
+        if(token == ";"):
+            text = "".join(prelude).strip()
+            if(text):
+                items.append(("statement", text))
+            prelude = []
+        elif(token == "{"):
+            text = "".join(prelude).strip()
+            prelude = []
+            depth = 1
+            start = index
+            while(depth):
+                if(index >= len(tokens)):
+                    raise ValueError("Unclosed block")
+                if(tokens[index] == "{"):
+                    depth += 1
+                elif(tokens[index] == "}"):
+                    depth -= 1
+                index += 1
+            body = tokens[start:index - 1]
+            if(text.startswith("@") or "{" in body):
+                items.append(("block", text, body))
+            else:
+                items.append(("rule", split_selectors(text), parse_declarations(body)))
+        elif(token == "}"):
+            raise ValueError("Unbalanced braces")
+        else:
+            prelude.append(token)
+
+    if("".join(prelude).strip()):
+        items.append(("statement", "".join(prelude).strip()))
+    return items
+
+# Only a later value GTK is sure to accept may replace an earlier one
+def is_known_value(value):
+    return all(name.lower() in known_functions for name in function_pattern.findall(string_pattern.sub("", value)))
+
+def serialize_declarations(declarations):
+    return ";".join(f"{name}:{value}{'!important' if important else ''}" for name, value, important in declarations)
+
+# With split_rules, every selector of a list is handled on its own and rules are
+# merged across lists. Without it a selector list stays one unit, since GTK
+# drops the whole rule when any selector in it is invalid.
+def optimize(items, split_rules=True):
+    # One entry per selector, so overrides can be found for each selector on its own
+    entries = []
+    for item in items:
+        if(item[0] == "rule"):
+            for selector in (item[1] if split_rules else [",".join(item[1])]):
+                entries.append((selector, item[2]))
+        else:
+            entries.append(item)
+
+    colors = {}
+    winners = {}
+    for index, entry in enumerate(entries):
+        if(entry[0] == "statement"):
+            parts = entry[1].split(None, 2)
+            if(parts[0] == "@define-color" and len(parts) == 3):
+                colors[parts[1]] = index
+        elif(entry[0] != "block"):
+            for position, (name, value, important) in enumerate(entry[1]):
+                if(not is_known_value(value)):
+                    continue
+                key = (entry[0], name)
+                # !important only loses to a later !important
+                if(key not in winners or important or not winners[key][2]):
+                    winners[key] = (index, position, important)
+
+    output = []
+    group = None
+    for index, entry in enumerate(entries):
+        if(entry[0] in ["statement", "block"]):
+            if(entry[0] == "statement"):
+                parts = entry[1].split(None, 2)
+                if(parts[0] == "@define-color" and len(parts) == 3 and colors[parts[1]] != index):
+                    continue
+                output.append(minify_value(entry[1]) + ";")
+            else:
+                output.append(minify_selector(entry[1]) + "{" + minify_block(entry[2]) + "}")
+            group = None
+            continue
+
+        selector, declarations = entry
+        declarations = [
+            declaration for position, declaration in enumerate(declarations)
+            if(not is_known_value(declaration[1]) or winners.get((selector, declaration[0]), ())[:2] == (index, position))
+        ]
+        if(not declarations):
+            continue
+
+        if(group and group[0] == [selector]):
+            group[1].extend(declarations)
+        elif(split_rules and group and group[1] == declarations):
+            group[0].append(selector)
+        else:
+            group = [[selector], declarations]
+            output.append(group)
+
+    return "".join(
+        item if isinstance(item, str) else ",".join(item[0]) + "{" + serialize_declarations(item[1]) + "}"
+        for item in output
+    )
+
+def get_color_definitions(items):
+    definitions = {}
+    for item in items:
+        if(item[0] == "statement"):
+            parts = item[1].split(None, 2)
+            if(parts[0] == "@define-color" and len(parts) == 3):
+                definitions.pop(parts[1], None) # Keeps the order of the last definition
+                definitions[parts[1]] = minify_value(parts[2])
+    return definitions
+
+# Every color defined in the sheet with its references replaced by literals. Colors
+# the sheet does not define itself (libadwaita's own) stay as references.
+def resolve_palette(items):
+    definitions = get_color_definitions(items)
+    resolved = {}
+
+    def resolve(name, seen):
+        if(name in resolved):
+            return resolved[name]
+        def replace(match):
+            if(match.group(1) in definitions and match.group(1) not in seen):
+                return resolve(match.group(1), seen | {match.group(1)})
+            return match.group(0)
+        value = reference_pattern.sub(replace, definitions[name])
+        if(not seen - {name}):
+            resolved[name] = value
+        return value
+
+    return {name: resolve(name, {name}) for name in definitions}
+
+# Each color defined once, as a literal, at the top of an optimized sheet
+def flatten_css(css):
+    try:
+        items = parse(css)
+    except ValueError as e:
+        print(f"Could not flatten stylesheet: {e}")
+        return css
+
+    palette = resolve_palette(items)
+    rules = [item for item in items if not (item[0] == "statement" and item[1].split(None, 1)[0] == "@define-color")]
+    # The sheet may hold CSS pasted on the Custom page, so selector lists are left as they are
+    return optimize([("statement", f"@define-color {name} {value}") for name, value in palette.items()] + rules, split_rules=False)
+
+def optimize_css(css):
+    try:
+        return optimize(parse(css))
+    except ValueError as e:
+        # A broken sheet is written as it is rather than guessed at
+        print(f"Could not optimize stylesheet: {e}")
+        return css
@@ -17,146 +17,472 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+# The image engine. It has no GTK or portal dependencies so it can also run
+# headless or be used as a library. remap_palette, remap_palette_async,
+# remap_palettes and remap_batch take file paths, PIL images or NumPy arrays.
+# The GTK and portal side lives in wallpaper.py and wallpaper_dialog.py
+
 from PIL import Image
 import numpy as np
+import os, time, asyncio, functools
+
+from .colors import hex_to_rgb
+from .tracing import span
 
-import gi, os, asyncio, random
-gi.require_version('XdpGtk4', '1.0')
-from gi.repository import Gtk, GLib, Gio, Xdp, XdpGtk4, Adw, Gdk
-from .loading_dialog import LoadingDialog
+block_size = 65536 # Rows per distance block, keeps the scratch buffer around 2 MB
 
-picture_path = os.path.join(GLib.get_user_data_dir(), "wallpapers")
+def squared_norms(points):
+    return np.einsum("ij,ij->i", points, points)
 
-def hex_to_rgb(hex_color):
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+# k-means++ seeding. Only the distance to the newest centroid is computed in each
+# round, the nearest distance so far is kept in min_dists.
+def compute_centroids(arr, n_clusters, rng=np.random):
+    points = np.asarray(arr, dtype=np.float32)
+    norms = squared_norms(points)
+    min_dists = np.full(len(points), np.inf, dtype=np.float32)
+    dists = np.empty(len(points), dtype=np.float32)
 
-def compute_centroids(arr, n_clusters):
-    centroids = []
-    centroids.append(arr[np.random.choice(len(arr))])
+    centroids = [points[rng.choice(len(points))]]
     for _ in range(1, n_clusters):
-        dists = np.min(np.linalg.norm(arr[:, None] - np.array(centroids)[None, :], axis=2), axis=1)
-        probs = dists / np.sum(dists)
-        next_centroid = arr[np.random.choice(len(arr), p=probs)]
-        centroids.append(next_centroid)
+        centroid = centroids[-1]
+        # ‖x‖² − 2x·c + ‖c‖²
+        np.matmul(points, centroid * -2, out=dists)
+        dists += norms
+        dists += centroid @ centroid
+        np.minimum(min_dists, dists, out=min_dists)
+
+        probs = np.sqrt(np.maximum(min_dists, 0, out=dists), out=dists).astype(np.float64)
+        total = probs.sum()
+        # A single-color image leaves nothing to weigh by, so any point will do
+        centroids.append(points[rng.choice(len(points), p=probs / total if total > 0 else None)])
     return np.array(centroids)
 
-def simple_kmeans(arr, n_clusters=8, max_iter=10):
-    centroids = compute_centroids(arr, n_clusters)
+# Nearest centroid for every point. ‖x‖² is the same for every centroid so it is
+# left out, which leaves one float32 matrix product per block.
+def assign_labels(points, centroids, labels, buffer):
+    offsets = squared_norms(centroids)
+    scaled = (centroids * -2).T.copy()
+    for start in range(0, len(points), len(buffer)):
+        block = points[start:start + len(buffer)]
+        out = buffer[:len(block)]
+        np.matmul(block, scaled, out=out)
+        out += offsets
+        np.argmin(out, axis=1, out=labels[start:start + len(block)])
+    return labels
+
+def cluster_sums(channels, labels, n_clusters):
+    counts = np.bincount(labels, minlength=n_clusters)
+    sums = np.stack([np.bincount(labels, weights=channel, minlength=n_clusters) for channel in channels], axis=1)
+    return sums, counts
+
+def centroid_means(sums, counts, centroids):
+    # Empty clusters keep their old position
+    return np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centroids).astype(np.float32)
+
+def update_centroids(channels, labels, centroids):
+    return centroid_means(*cluster_sums(channels, labels, len(centroids)), centroids)
+
+def get_rng(seed):
+    return np.random if seed is None else np.random.default_rng(seed)
+
+def simple_kmeans(arr, n_clusters=8, max_iter=10, seed=None, stats=None):
+    points = np.asarray(arr, dtype=np.float32)
+    channels = np.ascontiguousarray(points.T, dtype=np.float64) # bincount weights, converted once
+    centroids = compute_centroids(points, n_clusters, get_rng(seed))
+
+    labels = np.empty(len(points), dtype=np.intp)
+    buffer = np.empty((min(block_size, len(points)), n_clusters), dtype=np.float32)
+    iteration_ms = []
     for _ in range(max_iter):
-        distances = np.linalg.norm(arr[:, None] - centroids[None, :], axis=2)
-        labels = np.argmin(distances, axis=1)
-        new_centroids = np.array([
-            arr[labels == i].mean(axis=0) if np.any(labels == i) else centroids[i]
-            for i in range(n_clusters)
-        ])
+        begin = time.perf_counter()
+        assign_labels(points, centroids, labels, buffer)
+        new_centroids = update_centroids(channels, labels, centroids)
+        iteration_ms.append((time.perf_counter() - begin) * 1000)
         if(np.allclose(centroids, new_centroids, atol=1e-2)):
             break
         centroids = new_centroids
+
+    if(stats is not None):
+        stats.update(iterations=len(iteration_ms), iteration_ms=iteration_ms)
     return labels, centroids
 
-async def remap_palette(image_path, target_palette_hex, n_colors=8, blend=1.0):
-    target_palette = [hex_to_rgb(h) for h in target_palette_hex]
+# Distance to the closest and second closest centroid, for every point or the ones
+# in index. Points come one channel per row, since gathering from rows is faster.
+#
+# The lowest bits of each distance are replaced by the centroid's index. Positive
+# floats sort the same as their bits do as integers, so a running minimum over
+# the int32 view finds the nearest distance and its label together, which is far
+# cheaper than argmin over a short axis.
+def bound_distances(columns, centroids, index, labels, upper, lower):
+    offsets = squared_norms(centroids)[:, None]
+    scaled = centroids * -2
+    mask = (1 << max((len(centroids) - 1).bit_length(), 1)) - 1
+    ids = np.arange(len(centroids), dtype=np.int32)[:, None]
+    infinity = np.float32(np.inf).view(np.int32)
+
+    total = columns.shape[1] if index is None else len(index)
+    for start in range(0, total, block_size):
+        rows = slice(start, start + block_size) if index is None else index[start:start + block_size]
+        block = columns[:, rows] if index is None else np.take(columns, rows, axis=1)
+        dists = scaled @ block
+        dists += offsets
+        dists += np.einsum("ij,ij->j", block, block)
+
+        keys = dists.view(np.int32)
+        np.maximum(keys, 0, out=keys) # Rounding can leave tiny negatives
+        keys &= ~mask
+        keys |= ids
+        best = keys[0].copy()
+        second = np.full_like(best, infinity)
+        for row in keys[1:]:
+            np.minimum(second, np.maximum(best, row), out=second)
+            np.minimum(best, row, out=best)
+
+        labels[rows] = best & mask
+        # The cleared bits rounded every distance down, so the upper bound takes the top of its range
+        best |= mask
+        second &= ~mask
+        upper[rows] = np.sqrt(best.view(np.float32))
+        lower[rows] = np.sqrt(second.view(np.float32))
+
+# Hamerly's k-means. Every point keeps an upper bound on the distance to its own
+# centroid and a lower bound on the distance to any other. While the upper bound
+# is below the lower bound, or below half the gap to the nearest other centroid,
+# the label cannot change and the point is skipped. Stops once no more than
+# `tol` of the points change label in an iteration.
+def hamerly_kmeans(arr, n_clusters=8, max_iter=10, tol=0.01, seed=None, stats=None):
+    points = np.asarray(arr, dtype=np.float32)
+    centroids = compute_centroids(points, n_clusters, get_rng(seed))
+    columns = np.ascontiguousarray(points.T)
+    count = len(points)
+    del points # Only the column copy is used from here on
+
+    labels = np.empty(count, dtype=np.intp)
+    upper = np.empty(count, dtype=np.float32)
+    lower = np.empty(count, dtype=np.float32)
+    bound = np.empty(count, dtype=np.float32)
+    bound_distances(columns, centroids, None, labels, upper, lower)
+    sums, counts = cluster_sums(columns, labels, n_clusters)
+
+    iteration_ms = []
+    skipped = []
+    changed = []
+    for _ in range(max_iter):
+        begin = time.perf_counter()
+        new_centroids = centroid_means(sums, counts, centroids)
+        moved = np.sqrt(((new_centroids - centroids) ** 2).sum(axis=1))
+        centroids = new_centroids
 
-    img = Image.open(image_path).convert("RGB")
-    arr = np.array(img).reshape(-1, 3)
+        # Moving the centroids loosens the bounds by at most how far they moved
+        np.take(moved, labels, out=bound)
+        upper += bound
+        lower -= moved.max()
+
+        between = np.sqrt(((centroids[:, None] - centroids[None, :]) ** 2).sum(axis=2))
+        np.fill_diagonal(between, np.inf)
+        np.take(between.min(axis=1) / 2, labels, out=bound)
+        np.maximum(bound, lower, out=bound)
+        candidates = np.flatnonzero(upper > bound)
+
+        if(len(candidates) > count // 3):
+            # Early on most points fail, and one pass over all of them beats gathering them
+            searched = count
+            previous = labels.copy()
+            bound_distances(columns, centroids, None, labels, upper, lower)
+            moving = np.flatnonzero(labels != previous)
+            previous = previous[moving]
+        else:
+            # Tightening the upper bound is one distance, only points that still fail get all of them
+            own = labels[candidates]
+            tight = np.zeros(len(candidates), dtype=np.float32)
+            for channel in range(3):
+                diff = np.take(columns[channel], candidates) - np.take(centroids[:, channel], own)
+                tight += diff * diff
+            np.sqrt(tight, out=tight)
+            upper[candidates] = tight
+            candidates = candidates[tight > bound[candidates]]
+            searched = len(candidates)
+            previous = labels[candidates]
+            bound_distances(columns, centroids, candidates, labels, upper, lower)
+            switched = labels[candidates] != previous
+            moving = candidates[switched]
+            previous = previous[switched]
+
+        # Only the points that switched cluster change the sums
+        moving_columns = np.take(columns, moving, axis=1)
+        old_sums, old_counts = cluster_sums(moving_columns, previous, n_clusters)
+        new_sums, new_counts = cluster_sums(moving_columns, labels[moving], n_clusters)
+        sums += new_sums - old_sums
+        counts += new_counts - old_counts
+
+        iteration_ms.append((time.perf_counter() - begin) * 1000)
+        skipped.append(1 - searched / count)
+        changed.append(len(moving) / count)
+        if(changed[-1] <= tol):
+            break
 
-    labels, centers = simple_kmeans(arr, n_clusters=n_colors)
+    if(stats is not None):
+        stats.update(iterations=len(iteration_ms), iteration_ms=iteration_ms, skipped=skipped, changed=changed)
+    return labels, centroids
 
-    palette_arr = np.array(target_palette)
+def kmeans_quantize(img, arr, n_colors, seed=None):
+    return hamerly_kmeans(arr, n_clusters=n_colors, seed=seed)
+
+# Clusters in CIELAB, where distances follow how different colors look
+def kmeans_lab_quantize(img, arr, n_colors, seed=None):
+    labels, centers = hamerly_kmeans(image_to_lab(arr), n_clusters=n_colors, seed=seed)
+    return labels, lab_to_rgb(centers)
+
+# Pillow's quantizers are deterministic and run in a single pass over the image
+def pil_quantize(img, n_colors, method):
+    if(not isinstance(img, Image.Image)):
+        img = Image.fromarray(img)
+    quantized = img.quantize(colors=n_colors, method=method)
+    labels = np.asarray(quantized).reshape(-1)
+    count = int(labels.max()) + 1 # Flat images can need fewer colors than asked for
+    centers = np.array(quantized.getpalette()[:count * 3], dtype=np.float64).reshape(-1, 3)
+    return labels, centers
+
+def median_cut_quantize(img, arr, n_colors, seed=None):
+    return pil_quantize(img, n_colors, Image.Quantize.MEDIANCUT)
+
+def octree_quantize(img, arr, n_colors, seed=None):
+    return pil_quantize(img, n_colors, Image.Quantize.FASTOCTREE)
+
+# Each one takes the image (or its (height, width, 3) array), its pixels as an (N, 3) array and a seed for the ones
+# that are random, and returns a cluster index for every pixel and the color of every cluster
+quantizers = {
+    "kmeans": kmeans_quantize,
+    "kmeans-lab": kmeans_lab_quantize,
+    "median-cut": median_cut_quantize,
+    "octree": octree_quantize,
+}
+
+lab_quantizers = ["kmeans-lab"]
+preview_size = 512 # Longest side of the preview, small enough to fit in well under a second
+
+def load_preview(image_path, size=preview_size):
+    img = Image.open(image_path)
+    img.draft("RGB", (size, size)) # JPEGs are decoded straight at a fraction of their size
+    img = img.convert("RGB")
+    img.thumbnail((size, size))
+    return img
+
+# The cluster index of every pixel and the RGB color of every cluster, for a PIL
+# image or a (height, width, 3) uint8 array
+def fit_palette(img, n_colors=8, quantizer="kmeans", seed=0):
+    arr = np.asarray(img).reshape(-1, 3)
+    with span("wallpaper quantize", quantizer=quantizer):
+        labels, centers = quantizers[quantizer](img, arr, n_colors, seed)
+    return labels, np.asarray(centers, dtype=np.float64)
+
+# Labels for another image, such as the full size one, from clusters fitted before.
+# Pixels are compared in the same space the quantizer fitted in.
+def label_pixels(arr, centers, quantizer="kmeans"):
+    if(quantizer in lab_quantizers):
+        points = image_to_lab(arr)
+        centers = rgb_to_lab(np.asarray(centers).T).T
+    else:
+        points = np.asarray(arr, dtype=np.float32)
+    labels = np.empty(len(points), dtype=np.intp)
+    buffer = np.empty((min(block_size, len(points)), len(centers)), dtype=np.float32)
+    return assign_labels(points, np.asarray(centers, dtype=np.float32), labels, buffer)
+
+# The palette color each cluster becomes
+def blend_palette(centers, target_palette_hex, blend=1.0):
+    # Only n_colors x palette entries, small enough to do directly
+    palette_arr = np.array([hex_to_rgb(h) for h in target_palette_hex], dtype=np.float64)
     dists = np.linalg.norm(centers[:, None] - palette_arr[None, :], axis=2)
     closest_palette_idx = np.argmin(dists, axis=1)
     mapped_palette = palette_arr[closest_palette_idx]
+    return (mapped_palette * blend + centers * (1.0 - blend)).astype(np.uint8)
 
-    blended_colors = (mapped_palette * blend + centers * (1.0 - blend)).astype(np.uint8)
-
-    recolored = blended_colors[labels].reshape(img.size[1], img.size[0], 3)
-    recolored = np.clip(recolored, 0, 255)
-
+def render_palette(size, labels, colors):
+    with span("wallpaper remap"):
+        # A single full-size allocation, the lookup already gives uint8 in range
+        recolored = colors[labels].reshape(size[1], size[0], 3)
     return Image.fromarray(recolored)
 
-def make_new_image(parent, file_path):
-    from .theme_page import load_colors_from_css
-    output_path = os.path.join(picture_path, f"{os.path.basename(file_path)}-tinted.jpg")
-
-    theme_type = {
-        0: "light",
-        1: "dark",
-        2: "light",
-    }
-
-    if(parent.pref in [0, 2]):
-        theme = parent.light_theme
+# A fit is everything needed to tint the same image for another palette without
+# opening it again. Labels fit in a byte for up to 256 clusters.
+def save_fit(path, fit):
+    labels = fit["labels"].astype(np.uint8 if len(fit["centers"]) <= 256 else np.intp)
+    np.savez(path, size=np.array(fit["size"]), labels=labels, centers=fit["centers"], blend=fit["blend"], source=fit["source"])
+
+def load_fit(path):
+    with np.load(path) as data:
+        return {
+            "size": tuple(int(x) for x in data["size"]),
+            "labels": data["labels"],
+            "centers": data["centers"],
+            "blend": float(data["blend"]),
+            "source": str(data["source"]),
+        }
+
+# The size an image needs to still cover every monitor (width, height) when
+# scaled to fill it. Never larger than the image itself.
+def cover_size(size, monitors):
+    if(not monitors):
+        return tuple(size)
+    scale = min(1.0, max(max(width / size[0], height / size[1]) for width, height in monitors))
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+# A 12 megapixel photo for a 1080p screen is worked on at about 2 megapixels
+def load_image(image_path, monitors=None):
+    img = Image.open(image_path)
+    size = cover_size(img.size, monitors)
+    if(size != img.size):
+        img.draft("RGB", size) # Only ever decodes down to a size that still covers it
+    img = img.convert("RGB")
+    if(size != img.size):
+        img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    return img
+
+# The pixels of an image given as a file path, a PIL image or a (height, width, 3)
+# uint8 array. An array that needs no scaling is used as it is, without a copy.
+# Grayscale arrays are stacked to RGB and alpha is dropped.
+def load_pixels(source, monitors=None):
+    if(isinstance(source, np.ndarray)):
+        if(source.ndim == 2):
+            source = source[..., np.newaxis]
+        if(source.dtype != np.uint8 or source.ndim != 3 or source.shape[2] not in (1, 3, 4)):
+            raise ValueError(f"expected (h, w, 3) uint8, got {source.shape} {source.dtype}")
+        if(source.shape[2] == 1):
+            source = np.repeat(source, 3, axis=2)
+        elif(source.shape[2] == 4):
+            source = source[..., :3]
+        if(cover_size((source.shape[1], source.shape[0]), monitors) == (source.shape[1], source.shape[0])):
+            return np.ascontiguousarray(source)
+        source = Image.fromarray(source)
+    if(isinstance(source, Image.Image)):
+        img = source if source.mode == "RGB" else source.convert("RGB")
+        size = cover_size(img.size, monitors)
+        if(size != img.size):
+            img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
     else:
-        theme = parent.dark_theme
-
-    portal = Xdp.Portal()
-
-    if(theme == "default"):
-        dialog = Adw.AlertDialog.new()
-        dialog.set_body(_("Please select a theme first"))
-
-        dialog.add_response("ok", "_OK")
-
-        dialog.set_close_response("ok")
-        dialog.set_default_response("ok")
-
-        dialog.present(parent)
-        return
-
-    palette_vals = list(load_colors_from_css(os.path.join(parent.data_dir, theme_type[parent.pref], theme)).values())
-    palette_vals = [c for c in palette_vals if not c.startswith('@')]
-
-    spinner = LoadingDialog(parent)
-
-    def task_func(task, source_object, task_data, cancellable):
-        spinner.present(parent)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        img = loop.run_until_complete(remap_palette(file_path, palette_vals))
-        loop.close()
-
-        img.save(f"{output_path}")
-        task.return_value(output_path)
-
-    def on_done(task, result, user_data=None):
-        spinner.set_can_close(True), spinner.close()
-        top = XdpGtk4.parent_new_gtk(parent)
-        portal.set_wallpaper(
-            top,
-            f"file://{output_path}",
-            Xdp.WallpaperFlags.PREVIEW
-            | Xdp.WallpaperFlags.BACKGROUND
-            | Xdp.WallpaperFlags.LOCKSCREEN,
-        )
-
-    task = Gio.Task.new(None, None, on_done)
-    task.run_in_thread(task_func)
-
-def on_image_opened(file_dialog, result, parent):
-    file = file_dialog.open_finish(result)
-    file_path = file.get_path()
-    make_new_image(parent, file_path)
+        img = load_image(source, monitors)
+    return np.asarray(img)
+
+# The size, labels and centers of an image. Centers fitted earlier, on the
+# preview, skip the quantizer and only label the pixels.
+def fit_source(source, n_colors=8, quantizer="kmeans", seed=0, centers=None, monitors=None):
+    with span("wallpaper load"):
+        pixels = load_pixels(source, monitors)
+    size = (pixels.shape[1], pixels.shape[0])
+
+    if(centers is None):
+        labels, centers = fit_palette(pixels, n_colors, quantizer, seed)
+    else:
+        with span("wallpaper label", quantizer=quantizer):
+            labels = label_pixels(pixels.reshape(-1, 3), centers, quantizer)
+    return size, labels, centers
+
+# Images are a file path, a PIL image or a (height, width, 3) uint8 array. The
+# default seed keeps the same wallpaper and theme giving the same result. When
+# fit is a dict, it is filled in with what save_fit stores.
+def remap_palette(source, target_palette_hex, n_colors=8, blend=1.0, quantizer="kmeans", seed=0, centers=None, fit=None, monitors=None):
+    size, labels, centers = fit_source(source, n_colors, quantizer, seed, centers, monitors)
+    if(fit is not None):
+        fit.update(size=size, labels=labels, centers=centers, blend=blend, source=str(source) if isinstance(source, (str, os.PathLike)) else "image")
+    return render_palette(size, labels, blend_palette(centers, target_palette_hex, blend))
+
+# remap_palette for asyncio code. It runs on executor, or on the loop's default
+# thread pool, since NumPy and Pillow release the GIL for the heavy parts.
+async def remap_palette_async(source, target_palette_hex, executor=None, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(remap_palette, source, target_palette_hex, **kwargs))
+
+# One image for several palettes. It is only loaded and fitted once, every
+# palette after that costs one lookup per pixel.
+def remap_palettes(source, target_palettes, n_colors=8, blend=1.0, quantizer="kmeans", seed=0, centers=None, monitors=None):
+    size, labels, centers = fit_source(source, n_colors, quantizer, seed, centers, monitors)
+    return [render_palette(size, labels, blend_palette(centers, palette, blend)) for palette in target_palettes]
+
+# Several images on a thread pool, results in the same order. target_palettes is
+# one palette for all of them, or one palette per image. Every running job holds
+# a full image and its scratch arrays, so at most 4 run at once by default.
+def remap_batch(sources, target_palettes, max_workers=None, **kwargs):
+    from concurrent.futures import ThreadPoolExecutor
+    if(target_palettes and isinstance(target_palettes[0], str)):
+        target_palettes = [target_palettes] * len(sources)
+    if(max_workers is None):
+        max_workers = min(4, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers) as executor:
+        return list(executor.map(lambda source, palette: remap_palette(source, palette, **kwargs), sources, target_palettes))
+
+# File extension and Pillow save options for each output format, from a 1-100
+# quality. The fast presets skip the extra passes that only make the file a
+# few percent smaller.
+encoders = {
+    "jpeg": ("jpg", lambda quality: {"quality": quality, "optimize": True, "subsampling": 0 if quality >= 90 else 2}),
+    "jpeg-fast": ("jpg", lambda quality: {"quality": quality, "subsampling": 2}),
+    "png": ("png", lambda quality: {"optimize": True}),
+    "png-fast": ("png", lambda quality: {"compress_level": 1}),
+    "webp": ("webp", lambda quality: {"quality": quality, "method": 6}),
+    "webp-fast": ("webp", lambda quality: {"quality": quality, "method": 0}),
+}
+lockscreen_dim = 0.6 # Keeps the clock and notifications readable
+
+# Writes the recolored image as output_base plus the format's extension. Every
+# other monitor size can get a copy scaled to cover it, and the lock screen a
+# dimmed one, recolored from the same labels. Returns the paths written.
+def save_tinted(img, labels, colors, output_base, encoder="jpeg-fast", quality=90, monitors=None, monitor_variants=False, lockscreen=False):
+    extension, get_options = encoders[encoder]
+    options = get_options(quality)
+    outputs = {"background": f"{output_base}.{extension}", "lockscreen": None, "monitors": []}
+
+    with span("wallpaper save", encoder=encoder):
+        img.save(outputs["background"], **options)
+        if(monitor_variants):
+            for width, height in sorted(set(monitors or [])):
+                size = cover_size(img.size, [(width, height)])
+                if(size != img.size):
+                    path = f"{output_base}-{width}x{height}.{extension}"
+                    img.resize(size, Image.LANCZOS, reducing_gap=3.0).save(path, **options)
+                    outputs["monitors"].append(path)
+        if(lockscreen):
+            outputs["lockscreen"] = f"{output_base}-lockscreen.{extension}"
+            dimmed = (colors.astype(np.float32) * lockscreen_dim).astype(np.uint8)
+            render_palette(img.size, labels, dimmed).save(outputs["lockscreen"], **options)
+    return outputs
+
+# File to file versions of a tint and a re-tint, for worker.run_in_worker. Only
+# paths, the palette and the few centers go in and out, the pixels never leave
+# the worker. options are passed on to save_tinted.
+def tint_file(image_path, output_base, target_palette_hex, blend=1.0, quantizer="kmeans", centers=None, fit_path=None, **options):
+    fit = {}
+    img = remap_palette(image_path, target_palette_hex, blend=blend, quantizer=quantizer, centers=centers, fit=fit, monitors=options.get("monitors"))
+    outputs = save_tinted(img, fit["labels"], blend_palette(fit["centers"], target_palette_hex, blend), output_base, **options)
+    if(fit_path):
+        save_fit(fit_path, fit)
+    return outputs
+
+def retint_file(fit_path, output_dir, target_palette_hex, **options):
+    fit = load_fit(fit_path)
+    colors = blend_palette(fit["centers"], target_palette_hex, fit["blend"])
+    img = render_palette(fit["size"], fit["labels"], colors)
+    os.makedirs(output_dir, exist_ok=True)
+    return save_tinted(img, fit["labels"], colors, os.path.join(output_dir, f"{os.path.basename(fit['source'])}-tinted"), **options)
 
 # ciede2000 Implementation
 
-def rgb_to_xyz(rgb):
-    rgb = np.array(rgb) / 255.0
-
-    mask = rgb > 0.04045
-    rgb_lin = np.where(mask, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+srgb_to_xyz_matrix = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041]
+])
+d65_white = np.array([95.047, 100.0, 108.883])
 
-    M = np.array([
-        [0.4124564, 0.3575761, 0.1804375],
-        [0.2126729, 0.7151522, 0.0721750],
-        [0.0193339, 0.1191920, 0.9503041]
-    ])
+def srgb_to_linear(rgb):
+    rgb = np.array(rgb) / 255.0
+    return np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
 
-    return np.dot(M, rgb_lin) * 100
+def rgb_to_xyz(rgb):
+    return np.dot(srgb_to_xyz_matrix, srgb_to_linear(rgb)) * 100
 
 def xyz_to_lab(xyz):
     xyz = np.array(xyz)
-    ref = np.array([95.047, 100.0, 108.883])
+    ref = d65_white.reshape((3,) + (1,) * (xyz.ndim - 1)) # Also works on (3, N) arrays
 
     xyz = xyz / ref
 
@@ -174,6 +500,38 @@ def xyz_to_lab(xyz):
 def rgb_to_lab(rgb):
     return xyz_to_lab(rgb_to_xyz(rgb))
 
+# The same conversion for whole images, as (N, 3) uint8 pixels. An 8-bit channel
+# only has 256 linear values, so the gamma curve is a table lookup. Scaling by the
+# white point is folded into the XYZ matrix, and L, a and b are one more product.
+linear_table = srgb_to_linear(np.arange(256)).astype(np.float32)
+xyz_white_matrix = (srgb_to_xyz_matrix * 100 / d65_white[:, None]).T.astype(np.float32)
+lab_matrix = np.array([
+    [0, 500, 0],
+    [116, -500, 200],
+    [0, 0, -200]
+], dtype=np.float32)
+lab_offset = np.array([-16, 0, 0], dtype=np.float32)
+
+def image_to_lab(arr):
+    f = linear_table[np.asarray(arr, dtype=np.uint8)] @ xyz_white_matrix
+    dark = f <= 0.008856
+    linear_part = f[dark] * 7.787 + 16/116
+    np.cbrt(f, out=f)
+    f[dark] = linear_part
+    lab = f @ lab_matrix
+    lab += lab_offset
+    return lab
+
+# Back to 0-255 RGB, for the few cluster centers found in Lab
+def lab_to_rgb(lab):
+    lab = np.asarray(lab, dtype=np.float64)
+    fy = (lab[:, 0] + 16) / 116
+    f = np.stack([fy + lab[:, 1] / 500, fy, fy - lab[:, 2] / 200], axis=1)
+    xyz = np.where(f ** 3 > 0.008856, f ** 3, (f - 16/116) / 7.787) * d65_white / 100
+    linear = np.clip(xyz @ np.linalg.inv(srgb_to_xyz_matrix).T, 0, 1)
+    rgb = np.where(linear > 0.0031308, 1.055 * linear ** (1/2.4) - 0.055, 12.92 * linear)
+    return np.clip(rgb * 255, 0, 255)
+
 def deltaE2000(lab1, lab2):
     L1, a1, b1 = lab1
     L2, a2, b2 = lab2
@@ -231,19 +589,3 @@ def deltaE2000(lab1, lab2):
         Rt * (dCp / S_C) * (dHp / S_H)
     )
     return dE
-
-def ciede2000(rgb, palette):
-    palette = list(palette)
-
-    palette_rgb = [
-        tuple(int(h[i:i+2], 16) for i in (1,3,5))
-        for h in palette
-    ]
-
-    palette_lab = np.array([rgb_to_lab(c) for c in palette_rgb])
-    lab_input = rgb_to_lab(rgb)
-
-    diffs = np.array([deltaE2000(lab_input, lab) for lab in palette_lab])
-
-    idx = np.argmin(diffs)
-    return palette[idx]
@@ -24,8 +24,20 @@ gi.require_version('Adw', '1')
 gi.require_version('Xdp', '1.0')
 
 from gi.repository import Gtk, Gdk, Gio, Adw, GLib, Xdp, GObject
-from .window import RewaitaWindow
-from .pref_dialog import PrefDialog
+from . import tracing
+
+with tracing.span("import"):
+    from .applier import ThemeApplier
+    from .utils import get_portal_settings, sync_bundled_themes
+
+command_options = ["apply", "accent", "window-controls", "option"]
+
+# Names accepted by --option, mapped to their settings key
+option_keys = {
+    "transparency": "transparency",
+    "borders": "window",
+    "sharp": "sharp",
+}
 
 class RewaitaApplication(Adw.Application):
     def __init__(self):
@@ -45,36 +57,105 @@ class RewaitaApplication(Adw.Application):
             "Checks for when the accent color or light/dark mode changes",
             None,
         )
+        self.add_main_option(
+            "trace",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.NONE,
+            "Prints how long startup and theme changes take on exit (REWAITA_TRACE=FILE.json writes a Chrome trace)",
+            None,
+        )
+        self.add_main_option(
+            "apply",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.STRING,
+            "Sets the light or dark theme to THEME and applies it",
+            "light|dark THEME",
+        )
+        self.add_main_option(
+            "accent",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.NONE,
+            "Matches the current accent color again and re-applies the theme",
+            None,
+        )
+        self.add_main_option(
+            "window-controls",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.STRING,
+            "Sets the window control style",
+            "default|colored|macos",
+        )
+        self.add_main_option(
+            "option",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.STRING_ARRAY,
+            "Turns an extra option on or off, can be repeated",
+            "transparency|borders|sharp=on|off",
+        )
 
-        self.grab_prefs()
+        self.settings = None
+        self.portal = None
+        self.in_background = False
 
-    def grab_prefs(self):
-        win = RewaitaWindow
-        win.app_settings = Gio.Settings.new("io.github.swordpuffin.rewaita")
+    def do_startup(self):
+        Adw.Application.do_startup(self)
+        # Only the primary instance gets here, a forwarding instance never touches settings or the portal
+        self.app_settings = Gio.Settings.new("io.github.swordpuffin.rewaita")
+        self.applier = ThemeApplier(self.app_settings)
 
-        win.light_theme = win.app_settings.get_string("light-theme")
-        win.dark_theme = win.app_settings.get_string("dark-theme")
-        win.window_control = win.app_settings.get_string("window-controls")
-        win.modify_gtk3_theme = win.app_settings.get_boolean("modify-gtk3-theme")
-        win.modify_gnome_shell = win.app_settings.get_boolean("modify-gnome-shell")
-        win.run_in_background = win.app_settings.get_boolean("run-in-background")
-        win.transparency = win.app_settings.get_boolean("transparency")
-        win.borders = win.app_settings.get_boolean("window")
-        win.sharp = win.app_settings.get_boolean("sharp")
+    # Only needed to ask for background permission when the window opens, so a
+    # one-shot command or a --background start never creates it
+    def get_portal(self):
+        if(self.portal is None):
+            self.portal = Xdp.Portal()
+        return self.portal
+
+    def get_window(self):
+        win = self.props.active_window
+        if not win:
+            # The widget stack is only imported once there is a window to show
+            with tracing.span("import window"):
+                from .window import RewaitaWindow
+            with tracing.span("window"):
+                win = RewaitaWindow(application=self)
+            win.connect("close-request", self.on_close_request)
+        return win
+
+    def watch_settings(self):
+        if(self.settings is None):
+            self.settings = get_portal_settings()
+            self.settings.connect("changed", self.on_settings_changed)
+
+    # Links the bundled themes into the data dir, after an update they may be stale or missing
+    def sync_themes(self, theme_types=["light", "dark"]):
+        for theme_type in theme_types:
+            sync_bundled_themes(os.path.join(os.path.dirname(os.path.abspath(__file__)), theme_type), os.path.join(GLib.get_user_data_dir(), theme_type))
+
+    def run_background(self):
+        self.watch_settings()
+        if(not self.in_background):
+            self.in_background = True
+            self.sync_themes()
+            self.hold()
 
     def on_close_request(self, window, *args):
-        if(window.run_in_background):
-            window.hide()
-            return True
+        # The window is destroyed rather than hidden, only the settings watcher stays resident
+        if(self.app_settings.get_boolean("run-in-background")):
+            self.run_background()
+        elif(self.in_background):
+            self.in_background = False
+            self.release()
 
     def do_activate(self):
-        win = self.props.active_window
-        if not win:
-            win = RewaitaWindow(application=self)
+        win = self.get_window()
 
-        win.connect("close-request", self.on_close_request)
-        if(win.run_in_background):
-            win.portal.request_background(
+        if(self.app_settings.get_boolean("run-in-background")):
+            self.get_portal().request_background(
                 None,
                 "Automatic transitions between light/dark mode",
                 None,
@@ -84,17 +165,19 @@ class RewaitaApplication(Adw.Application):
             )
 
         win.present()
-        self.settings = Xdp.Portal().get_settings()
-        self.settings.connect("changed", self.on_settings_changed, win)
+        self.watch_settings()
 
-    def on_settings_changed(self, settings, namespace, key, value, win):
+    def on_settings_changed(self, settings, namespace, key, value):
         if(namespace == "org.freedesktop.appearance" and key == "color-scheme" or namespace == "org.gnome.desktop.interface" and key == "accent-color"):
-            win.on_theme_selected()
+            win = self.props.active_window
+            if(win):
+                win.on_theme_selected()
+            else:
+                self.applier.apply()
 
     def on_pref_clicked(self, action, _):
-        win = self.props.active_window
-        if not win:
-            win = RewaitaWindow(application=self)
+        from .pref_dialog import PrefDialog
+        win = self.get_window()
         dialog = PrefDialog(win)
         dialog.present(win)
 
@@ -140,13 +223,58 @@ X-Flatpak=io.github.swordpuffin.rewaita
 
     def do_command_line(self, args):
         options = args.get_options_dict().end().unpack()
-        win = self.props.active_window
-        if not win:
-            win = RewaitaWindow(application=self)
+        if(any(key in options for key in command_options)):
+            return self.run_command(args, options)
 
-        self.activate()
         if("background" in options):
-            win.emit("close-request")
+            self.run_background()
+        else:
+            self.activate()
+        return 0
+
+    # Applies straight through the ThemeApplier, so a fresh process never builds a widget.
+    # When an instance is already running GApplication forwards the command line to it instead.
+    def run_command(self, args, options):
+        if("apply" in options):
+            theme_type = options["apply"]
+            arguments = args.get_arguments()[1:]
+            if(theme_type not in ["light", "dark"] or len(arguments) != 1):
+                args.printerr("Usage: rewaita --apply light|dark THEME\n")
+                return 1
+
+            theme = arguments[0]
+            if(theme.lower() == "default"):
+                theme = "default"
+            else:
+                self.sync_themes([theme_type])
+                if(not theme.endswith(".css")):
+                    theme += ".css"
+                if(not os.path.isfile(os.path.join(GLib.get_user_data_dir(), theme_type, theme))):
+                    args.printerr(f"No {theme_type} theme named {arguments[0]}\n")
+                    return 1
+            self.app_settings.set_string(f"{theme_type}-theme", theme)
+
+        if("window-controls" in options):
+            if(options["window-controls"] not in ["default", "colored", "macos"]):
+                args.printerr("Usage: rewaita --window-controls default|colored|macos\n")
+                return 1
+            self.app_settings.set_string("window-controls", options["window-controls"])
+
+        for option in options.get("option", []):
+            key, _, value = option.partition("=")
+            if(key not in option_keys or value not in ["on", "off"]):
+                args.printerr("Usage: rewaita --option transparency|borders|sharp=on|off\n")
+                return 1
+            self.app_settings.set_boolean(option_keys[key], value == "on")
+
+        win = self.props.active_window
+        if(win):
+            win.load_prefs()
+            win.light_gallery.refresh(); win.dark_gallery.refresh()
+            win.on_theme_selected()
+        else:
+            self.applier.apply()
+        return 0
 
     def on_about_action(self, *args):
         about = Adw.AboutDialog(application_name='Rewaita',
@@ -0,0 +1,85 @@
+# tracing.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Opt-in timing of startup and apply phases.
+#
+# REWAITA_TRACE=1 or --trace prints a summary table to stderr on exit.
+# REWAITA_TRACE=/path/to/trace.json writes Chrome trace-event JSON instead,
+# which can be opened in about:tracing or https://ui.perfetto.dev
+
+import os, sys, time, json, atexit, threading
+from contextlib import contextmanager
+
+enabled = False
+output_path = None
+events = []
+start_time = time.perf_counter()
+
+def now():
+    return time.perf_counter()
+
+def enable(path=None):
+    global enabled, output_path
+    if(not enabled):
+        atexit.register(write)
+    enabled = True
+    output_path = path
+
+def record(name, begin, **args):
+    if(enabled):
+        end = time.perf_counter()
+        events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (begin - start_time) * 1e6,
+            "dur": (end - begin) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+@contextmanager
+def span(name, **args):
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, begin, **args)
+
+def write():
+    if(output_path):
+        with open(output_path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        return
+
+    totals = {}
+    for event in events:
+        count, total, longest = totals.get(event["name"], (0, 0.0, 0.0))
+        totals[event["name"]] = (count + 1, total + event["dur"], max(longest, event["dur"]))
+
+    print(f"{'phase':<32}{'count':>8}{'total ms':>12}{'max ms':>12}", file=sys.stderr)
+    for name, (count, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        print(f"{name:<32}{count:>8}{total / 1000:>12.2f}{longest / 1000:>12.2f}", file=sys.stderr)
+
+# Checked here rather than in main, so the import phase is traced too
+trace_env = os.environ.get("REWAITA_TRACE")
+if(trace_env):
+    enable(trace_env if trace_env.endswith(".json") else None)
+elif("--trace" in sys.argv):
+    enable()
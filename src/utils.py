@@ -20,13 +20,20 @@
 import gi, os, shutil
 from gi.repository import Gtk, Gdk, GLib, Xdp, Adw
 from .extra_options_box import sharp_corners_css
-from .image_modifier import hex_to_rgb, ciede2000
+from .colors import hex_to_rgb, ciede2000
+from .tracing import span
 
-settings = Xdp.Portal().get_settings()
+settings = None
 css_provider = Gtk.CssProvider()
 
+def get_portal_settings():
+    global settings
+    if(settings is None):
+        settings = Xdp.Portal().get_settings()
+    return settings
+
 def read_accent_color():
-    accent = settings.read_value("org.freedesktop.appearance", "accent-color")
+    accent = get_portal_settings().read_value("org.freedesktop.appearance", "accent-color")
     converted = tuple(int(x * 255) for x in accent)
     if(any(value < 0 for value in converted) or any(value > 255 for value in converted)):
         converted = (53, 132, 228) # Default Gnome blue
@@ -57,7 +64,6 @@ def parse_gtk_theme(colors, gnome_shell_css, theme_file, gtk3_file, modify_gtk3_
         for color_to_replace in ["window_bg_color", "headerbar_bg_color", "card_bg_color"]:
             rgb = hex_to_rgb(colors[color_to_replace])
             colors[color_to_replace] = f"rgba({rgb[0]}, {rgb[1]}, {rgb[2]}, 0.82)"
-        gtk3_file += ".background:not(.nautilus-desktop) { opacity: 0.95; }"
 
     # Panel colors
     colors["panel_bg_color"] = colors["window_bg_color"]
@@ -68,29 +74,32 @@ def parse_gtk_theme(colors, gnome_shell_css, theme_file, gtk3_file, modify_gtk3_
     items_to_replace = ["window_bg_color", "window_fg_color", "card_bg_color", "headerbar_bg_color", "accent_color", "border_color", "red_1", "panel_bg_color", "panel_fg_color", "panel_button_bg_color", "panel_hover_bg_color", "overview_bg_color"]
 
     if(modify_gtk3_theme):
-        for color in colors.keys():
-            gtk3_file = gtk3_file.replace(f"@{color}", colors[color])
+        with span("gtk3 render"):
+            for color in colors.keys():
+                gtk3_file = gtk3_file.replace(f"@{color}", colors[color])
 
-        gtk3_theme_file = os.path.join(GLib.getenv("HOME"), ".config", "gtk-3.0", "gtk.css")
-        with open(gtk3_theme_file, "w") as file:
-            file.write(gtk3_file)
+        with span("gtk3 write"):
+            gtk3_theme_file = os.path.join(GLib.getenv("HOME"), ".config", "gtk-3.0", "gtk.css")
+            with open(gtk3_theme_file, "w") as file:
+                file.write(gtk3_file)
 
     if(modify_gnome_shell and "GNOME" in GLib.getenv("XDG_CURRENT_DESKTOP")):
-        for item in items_to_replace:
-            gnome_shell_css = gnome_shell_css.replace(f"@{item}", colors[item])
+        with span("shell write"):
+            for item in items_to_replace:
+                gnome_shell_css = gnome_shell_css.replace(f"@{item}", colors[item])
 
-        gnome_shell_theme_dir = os.path.join(GLib.getenv("HOME"), ".local", "share", "themes", "rewaita", "gnome-shell")
-        os.makedirs(gnome_shell_theme_dir, exist_ok=True)
-        file = shutil.copyfile(theme_file, os.path.join(gnome_shell_theme_dir, "gnome-shell.css"))
+            gnome_shell_theme_dir = os.path.join(GLib.getenv("HOME"), ".local", "share", "themes", "rewaita", "gnome-shell")
+            os.makedirs(gnome_shell_theme_dir, exist_ok=True)
+            file = shutil.copyfile(theme_file, os.path.join(gnome_shell_theme_dir, "gnome-shell.css"))
 
-        if(app_settings.get_boolean("sharp")):
-            gnome_shell_css += f"\n\n{sharp_corners_css}"
-        with open(file, "w") as f:
-            f.write(gnome_shell_css)
+            if(app_settings.get_boolean("sharp")):
+                gnome_shell_css += f"\n\n{sharp_corners_css}"
+            with open(file, "w") as f:
+                f.write(gnome_shell_css)
 
         reset_func()
 
-def set_to_default(config_dirs, theme_type, reset_func, extras):
+def set_to_default(config_dirs, reset_func, extras):
     for config_dir in config_dirs:
         with open(os.path.join(config_dir, "gtk.css"), "w") as file:
             file.write(extras)
@@ -98,140 +107,77 @@ def set_to_default(config_dirs, theme_type, reset_func, extras):
     gnome_shell_path = os.path.join(GLib.getenv("HOME"), ".local", "share", "themes", "rewaita", "gnome-shell")
     if(os.path.exists(os.path.join(gnome_shell_path, "gnome-shell.css"))):
         os.remove(os.path.join(gnome_shell_path, "gnome-shell.css"))
-
-    gtk_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"default-{theme_type}.css")
-    gtk_css = open(gtk_file).read()
-    add_css_provider(gtk_css + extras, f"rgb{read_accent_color()}")
         
     if("GNOME" in GLib.getenv("XDG_CURRENT_DESKTOP")):
         reset_func()
 
-def confirm_delete(dialog, response, button, window):
+def sync_bundled_themes(src, out):
+    os.makedirs(out, exist_ok=True)
+
+    bundled = sorted(name for name in os.listdir(src) if os.path.isfile(os.path.join(src, name)))
+    stamp = "\n".join([src] + bundled)
+    stamp_file = os.path.join(GLib.get_user_data_dir(), f".{os.path.basename(out)}-bundle")
+
+    # Still checked against the folder, so a deleted folder or link comes back
+    try:
+        with open(stamp_file, "r") as file:
+            if(file.read() == stamp and set(bundled) <= set(os.listdir(out))):
+                return
+    except OSError:
+        pass
+
+    for name in bundled:
+        src_path = os.path.join(src, name)
+        out_path = os.path.join(out, name)
+
+        if(os.path.islink(out_path) and os.readlink(out_path) == src_path):
+            continue
+        if(os.path.lexists(out_path)):
+            os.remove(out_path)
+
+        os.symlink(src_path, out_path)
+
+    # Links left behind by themes that are no longer bundled
+    for name in os.listdir(out):
+        out_path = os.path.join(out, name)
+        if(name not in bundled and os.path.islink(out_path) and not os.path.exists(out_path)):
+            os.remove(out_path)
+
+    with open(stamp_file, "w") as file:
+        file.write(stamp)
+
+def confirm_delete(dialog, response, item, window):
     if(response == "confirm"):
         window.toast_overlay.dismiss_all()
-        # Bear with me through this
-        window.toast_overlay.add_toast(Adw.Toast(timeout=3, title=button.theme + _(" has been deleted")))
-        button.get_parent().get_parent().remove(button.get_parent())
-        os.remove(button.path)
+        window.toast_overlay.add_toast(Adw.Toast(timeout=3, title=item.name + _(" has been deleted")))
+        getattr(window, f"{item.theme_type}_gallery").remove_theme(item)
+        os.remove(item.path)
 
-def delete_theme(button, window):
+def delete_theme(card, window):
     dialog = Adw.AlertDialog()
-    button.theme = button.theme.replace('.css', '')
-    dialog.set_heading(_("Delete ") + f"{button.theme}?")
+    dialog.set_heading(_("Delete ") + f"{card.item.name}?")
     dialog.set_body(_("Are you sure you want to delete that theme?\nThis cannot be undone."))
     
     dialog.add_response("cancel", _("Cancel"))
     dialog.add_response("confirm", _("Delete"))
     dialog.set_response_appearance("confirm", Adw.ResponseAppearance.DESTRUCTIVE)
 
-    dialog.connect("response", confirm_delete, button, window)
+    # The card may be recycled for another theme before the dialog is answered
+    dialog.connect("response", confirm_delete, card.item, window)
     dialog.present(window)
     
 def delete_items(action, _, button, window):
-    if(button.has_css_class("destructive-action")):
-        button.remove_css_class("destructive-action")
-        for flowbox in [window.light_flowbox, window.dark_flowbox]:
-            for theme in flowbox:
-                child = theme.get_first_child()
-                if(not child.has_css_class("delete-action")):
-                    child.set_sensitive(True)
-                    window.light_button.set_sensitive(True); window.dark_button.set_sensitive(True);
-                    continue
-                child.remove_css_class("delete-action"); child.remove_css_class("shake")
-                child.disconnect_by_func(delete_theme)
-                child.connect("clicked", window.on_theme_button_clicked, child.theme, child.theme_type)
-    else:
+    window.delete_mode = not button.has_css_class("destructive-action")
+    if(window.delete_mode):
         button.add_css_class("destructive-action")
-        for flowbox in [window.light_flowbox, window.dark_flowbox]:
-            for theme in flowbox:
-                child = theme.get_first_child()
-                if(child.has_css_class("active-scheme") or child.default):
-                    child.set_sensitive(False)
-                    window.light_button.set_sensitive(False); window.dark_button.set_sensitive(False);
-                    continue
-                child.add_css_class("delete-action")
-                child.add_css_class("shake")
-                child.disconnect_by_func(child.func)
-                child.connect("clicked", delete_theme, window)
-
-def set_gtk3_theme(gtk3_config_dir, window_control):
+    else:
+        button.remove_css_class("destructive-action")
+
+    window.light_button.set_sensitive(not window.delete_mode); window.dark_button.set_sensitive(not window.delete_mode);
+    for gallery in [window.light_gallery, window.dark_gallery]:
+        gallery.refresh()
+
+def set_gtk3_theme(gtk3_config_dir):
     dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gtk3-template")
     assets = os.path.join(dir, "assets.tar.xz")
     shutil.unpack_archive(assets, extract_dir=gtk3_config_dir, format="tar")
-
-    with open(os.path.join(gtk3_config_dir, "gtk.css"), "a") as file:
-        if(window_control == "colored"):
-            file.write("""
-                button.minimize.titlebutton:not(.suggested-action):not(.destructive-action) {
-                  background: alpha(@yellow_1,0.1);
-                  color: @yellow_1;
-                }
-
-                button.minimize.titlebutton:backdrop:not(.suggested-action):not(.destructive-action) {
-                  color: shade(@yellow_1,0.5);
-                }
-
-                button.maximize.titlebutton:not(.suggested-action):not(.destructive-action) {
-                  background: alpha(@green_1,0.1);
-                  color: @green_1;
-                }
-
-                button.maximize.titlebutton:backdrop:not(.suggested-action):not(.destructive-action) {
-                  color: shade(@green_1,0.5);
-                }
-
-                button.close.titlebutton:not(.suggested-action):not(.destructive-action) {
-                  background: alpha(@red_1,0.1);
-                  color: @red_1;
-                }
-
-                button.close.titlebutton:backdrop:not(.suggested-action):not(.destructive-action) {
-                  color: shade(@red_1,0.5);
-                }
-            """)
-        elif(window_control == "macos"):
-            file.write("""
-                button.minimize.titlebutton:not(.suggested-action):not(.destructive-action) {
-                  background-color: @yellow_1;
-                  min-width: 16px;
-                  min-height: 16px;
-                  color: transparent;
-                }
-
-                button.minimize.titlebutton:active:not(.suggested-action):not(.destructive-action) {
-                  background-color: shade(@yellow_1, 0.8);
-                }
-
-                button.maximize.titlebutton:not(.suggested-action):not(.destructive-action) {
-                  background-color: @green_1;
-                  min-width: 16px;
-                  min-height: 16px;
-                  color: transparent;
-                }
-
-                button.maximize.titlebutton:active:not(.suggested-action):not(.destructive-action) {
-                  background-color: shade(@green_1, 0.8);
-                }
-
-                button.close.titlebutton:not(.suggested-action):not(.destructive-action) {
-                  background-color: @red_1;
-                  min-width: 16px;
-                  min-height: 16px;
-                  color: transparent;
-                }
-
-                button.close.titlebutton:active:not(.suggested-action):not(.destructive-action) {
-                  background-color: shade(@red_1, 0.8);
-                }
-
-                button.minimize.titlebutton:backdrop:not(.suggested-action):not(.destructive-action), button.maximize.titlebutton:backdrop:not(.suggested-action):not(.destructive-action), button.close.titlebutton:backdrop:not(.suggested-action):not(.destructive-action) {
-                  color: transparent;
-                }
-
-                button.minimize.titlebutton:backdrop:hover:not(.suggested-action):not(.destructive-action), button.minimize.titlebutton:backdrop:active:not(.suggested-action):not(.destructive-action), button.maximize.titlebutton:backdrop:hover:not(.suggested-action):not(.destructive-action), button.maximize.titlebutton:backdrop:active:not(.suggested-action):not(.destructive-action), button.close.titlebutton:backdrop:hover:not(.suggested-action):not(.destructive-action), button.close.titlebutton:backdrop:active:not(.suggested-action):not(.destructive-action),
-                button.maximize.titlebutton:hover:not(.suggested-action):not(.destructive-action), button.close.titlebutton:hover:not(.suggested-action):not(.destructive-action),
-                button.minimize.titlebutton:hover:not(.suggested-action):not(.destructive-action) {
-                  color: @window_bg_color;
-                }
-            """
-            )
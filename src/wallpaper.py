@@ -0,0 +1,229 @@
+# wallpaper.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Wallpaper work that runs outside the dialog. Every full size tint goes through
+# one job queue, and each job runs in its own short-lived process, so this one
+# keeps none of its memory. When "retint-wallpaper" is on, the labels and centers
+# of the last tint are kept in the cache, and every theme apply recolors them
+# with the new palette. Only the palette mapping and the JPEG encode run again,
+# never the quantizer. Images are worked on at the size the connected monitors
+# need, not the size of the file. No widgets, so the background service can use it.
+
+import os, json, shutil, tempfile
+from collections import deque
+from gi.repository import Gdk, Gio, GLib, Xdp
+from .tracing import span
+from .worker import run_in_worker
+
+picture_path = os.path.join(GLib.get_user_data_dir(), "wallpapers")
+fit_path = os.path.join(GLib.get_user_cache_dir(), "rewaita", "wallpaper-fit.npz")
+retint_path = os.path.join(GLib.get_user_cache_dir(), "rewaita", "wallpaper-retint.json")
+latest_retint = None
+
+# Image jobs run here instead of in a thread each. At most "wallpaper-jobs" run
+# at once and the rest wait their turn, so several dropped files do not all
+# fight over memory. A job that is already waiting or running is not added
+# again. Callbacks are delivered by Gio.Task on the main loop, so they may touch widgets.
+class JobQueue:
+    def __init__(self):
+        self.pending = deque()
+        self.active = set()
+        self.running = 0
+
+    def get_limit(self):
+        app_settings = getattr(Gio.Application.get_default(), "app_settings", None)
+        return app_settings.get_int("wallpaper-jobs") if app_settings else 1
+
+    # func runs in a worker thread and on_done(result, error) on the main loop.
+    # Returns False when an identical job is already queued.
+    def submit(self, key, func, on_done):
+        if(key in self.active):
+            return False
+        self.active.add(key)
+        self.pending.append((key, func, on_done))
+        self.start_next()
+        return True
+
+    def start_next(self):
+        while(self.pending and self.running < self.get_limit()):
+            self.run(*self.pending.popleft())
+
+    def run(self, key, func, on_done):
+        self.running += 1
+        output = {}
+
+        def task_func(task, source_object, task_data, cancellable):
+            try:
+                output["result"] = func()
+            except Exception as e:
+                output["error"] = e
+            task.return_boolean(True)
+
+        def on_task_done(task, result, user_data=None):
+            self.running -= 1
+            self.active.discard(key)
+            self.start_next()
+            on_done(output.get("result"), output.get("error"))
+
+        task = Gio.Task.new(None, None, on_task_done)
+        task.run_in_thread(task_func)
+
+jobs = JobQueue()
+
+# Pixel size of every connected monitor, empty without a display
+def get_monitor_sizes():
+    display = Gdk.Display.get_default()
+    if(display is None):
+        return []
+    sizes = []
+    monitors = display.get_monitors()
+    for index in range(monitors.get_n_items()):
+        monitor = monitors.get_item(index)
+        geometry = monitor.get_geometry()
+        scale = monitor.get_scale()
+        sizes.append((round(geometry.width * scale), round(geometry.height * scale)))
+    return sizes
+
+# What image_modifier.save_tinted needs from the settings. Read on the main
+# thread, since Gdk may not be used from the job queue's workers.
+def get_output_options(app_settings):
+    return {
+        "monitors": get_monitor_sizes() if app_settings.get_boolean("wallpaper-fit-monitors") else None,
+        "encoder": app_settings.get_string("wallpaper-format"),
+        "quality": app_settings.get_int("wallpaper-quality"),
+        "monitor_variants": app_settings.get_boolean("wallpaper-monitor-variants"),
+        "lockscreen": app_settings.get_boolean("wallpaper-lockscreen-variant"),
+    }
+
+# Hands a tint's outputs to the portal. With a lock screen variant the background
+# is set first, and the lock screen only once that went through, so cancelling
+# the preview cancels both. on_done is called at the end either way.
+def set_wallpaper(outputs, parent=None, preview=False, on_done=None):
+    portal = Xdp.Portal()
+    flags = Xdp.WallpaperFlags.BACKGROUND
+    if(not outputs["lockscreen"]):
+        flags |= Xdp.WallpaperFlags.LOCKSCREEN
+    if(preview):
+        flags |= Xdp.WallpaperFlags.PREVIEW
+
+    def finish():
+        if(on_done):
+            on_done()
+
+    def on_lockscreen_set(portal, result, user_data=None):
+        try:
+            portal.set_wallpaper_finish(result)
+        except GLib.Error as e:
+            print(f"Could not set the lock screen: {e.message}")
+        finish()
+
+    def on_background_set(portal, result, user_data=None):
+        try:
+            portal.set_wallpaper_finish(result)
+        except GLib.Error as e:
+            print(f"Could not set the wallpaper: {e.message}")
+            finish()
+            return
+        if(not outputs["lockscreen"]):
+            finish()
+            return
+        portal.set_wallpaper(parent, f"file://{outputs['lockscreen']}", Xdp.WallpaperFlags.LOCKSCREEN, None, on_lockscreen_set, None)
+
+    portal.set_wallpaper(parent, f"file://{outputs['background']}", flags, None, on_background_set, None)
+
+def forget_fit():
+    for path in [fit_path, retint_path]:
+        if(os.path.exists(path)):
+            os.remove(path)
+
+# What the last re-tint was made from. The fit's mtime is part of it, so a
+# newly tinted image is never mistaken for the old one.
+def get_retint_key(palette_vals, theme_name, options):
+    key = {"theme": theme_name, "palette": list(palette_vals), "options": options, "fit": os.stat(fit_path).st_mtime_ns}
+    return json.loads(json.dumps(key))
+
+def read_retint_key():
+    try:
+        with open(retint_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def write_retint_key(key):
+    with open(retint_path, "w") as file:
+        json.dump(key, file)
+
+# Moves a re-tint out of its staging folder over the source's one tinted output
+def publish_outputs(outputs, staging):
+    def move(path):
+        target = os.path.join(picture_path, os.path.basename(path))
+        os.replace(path, target)
+        return target
+
+    published = {
+        "background": move(outputs["background"]),
+        "lockscreen": move(outputs["lockscreen"]) if outputs["lockscreen"] else None,
+        "monitors": [move(path) for path in outputs["monitors"]],
+    }
+    shutil.rmtree(staging, ignore_errors=True)
+    return published
+
+def retint_wallpaper(palette_vals, theme_name):
+    global latest_retint
+    if(not os.path.exists(fit_path)):
+        return
+
+    app = Gio.Application.get_default()
+    options = get_output_options(app.app_settings) if app else {}
+    # Quick theme switches only set the last render as the wallpaper, and
+    # applying with the same palette and options leaves it alone
+    key = get_retint_key(palette_vals, theme_name, options)
+    latest_retint = key
+    if(key == read_retint_key()):
+        return
+
+    # Rendered to a folder of its own, so a render that was overtaken never
+    # touches the file that is set as the wallpaper
+    os.makedirs(picture_path, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".retint-", dir=picture_path)
+
+    def release():
+        if(app):
+            app.release()
+
+    def render():
+        with span("wallpaper retint"):
+            return run_in_worker(f"{__package__}.image_modifier", "retint_file", fit_path, staging, palette_vals, **options)
+
+    def on_done(outputs, error):
+        if(error):
+            print(f"Could not re-tint the wallpaper: {error}")
+        if(error or key != latest_retint):
+            shutil.rmtree(staging, ignore_errors=True)
+            release()
+            return
+        outputs = publish_outputs(outputs, staging)
+        write_retint_key(key)
+        # No preview, this usually runs with no window open
+        set_wallpaper(outputs, on_done=release)
+
+    if(not jobs.submit(json.dumps(key, sort_keys=True), render, on_done)):
+        shutil.rmtree(staging, ignore_errors=True)
+    elif(app):
+        app.hold() # Keeps a one-shot run alive until the portal has the file
@@ -2,7 +2,6 @@ import gi, shutil, os
 gi.require_version("Gtk", "4.0")
 gi.require_version('GtkSource', '5')
 from gi.repository import Gtk, Gdk, Adw, GLib, GtkSource, Gio
-from .theme_page import load_colors_from_css, create_color_thumbnail_button
 
 #Stripped down colors for the time being
 gnome_colors = {
@@ -96,10 +95,8 @@ titles = {
     "dark_1": "Dark",
 }
 
-rgba_pickers = []
-
 class ColorRow(Adw.ActionRow):
-    def __init__(self, title: str, variable: str, default_color: str):
+    def __init__(self, title: str, variable: str, default_color: str, pickers: list):
         super().__init__(selectable=False)
         self.set_title(title)
         self.set_subtitle(variable)
@@ -109,7 +106,7 @@ class ColorRow(Adw.ActionRow):
         self.color_button = Gtk.ColorButton()
         self.color_button.set_rgba(rgba)
         self.color_button.variable = variable
-        rgba_pickers.append(self.color_button)
+        pickers.append(self.color_button)
 
         end_box = Gtk.Box(spacing=6)
         end_box.append(self.color_button)
@@ -117,7 +114,7 @@ class ColorRow(Adw.ActionRow):
         self.add_suffix(end_box)
 
 class CustomBundle(Gtk.Box):
-    def __init__(self, title: Gtk.Label, bundle: str):
+    def __init__(self, title: Gtk.Label, bundle: str, pickers: list):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=10, margin_start=12, margin_end=12)
         self.prepend(title)
         title.add_css_class("title-4")
@@ -129,13 +126,14 @@ class CustomBundle(Gtk.Box):
         listbox.add_css_class("boxed-list")
         for color in colors.keys():
             if(color == 'description'): continue
-            row = ColorRow(titles[color], color, colors[color])
+            row = ColorRow(titles[color], color, colors[color], pickers)
             listbox.append(row)
         self.append(listbox)
 
 class CustomPage(Gtk.Box):
     def __init__(self, parent):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=20, margin_top=20)
+        self.rgba_pickers = []
 
         accent_label = Gtk.Label(label=_("Accent Colors"))
         main_label = Gtk.Label(label=_("Main Colors"))
@@ -146,7 +144,7 @@ class CustomPage(Gtk.Box):
         colors_label = Gtk.Label(label=_("Named Colors"))
 
         for bundle, title in zip(gnome_colors.keys(), [accent_label, main_label, success_label, destructive_label, warning_label, interface_label, colors_label]):
-            self.append(CustomBundle(title, bundle))
+            self.append(CustomBundle(title, bundle, self.rgba_pickers))
 
         name_entry = Gtk.Entry(placeholder_text=_("Theme name (required)"), hexpand=True, width_request=250, halign=Gtk.Align.CENTER)
         name_entry.connect("changed", self.entry_changed)
@@ -216,7 +214,7 @@ class CustomPage(Gtk.Box):
 
         src_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "custom-template.css")
         src_file_text = open(src_file).read()
-        for color in rgba_pickers:
+        for color in self.rgba_pickers:
             rgb = color.get_rgba()
             hex_color = '#{:02x}{:02x}{:02x}'.format(
                 int(rgb.red * 255),
@@ -233,26 +231,8 @@ class CustomPage(Gtk.Box):
 
         match(theme_type):
             case("light"):
-                flowbox = parent.light_flowbox
+                gallery = parent.light_gallery
             case("dark"):
-                flowbox = parent.dark_flowbox
-
-        colors = load_colors_from_css(theme_file)
-        new_button = create_color_thumbnail_button(colors, entry.get_text(), flowbox.snippet)
-        new_button.connect("clicked", parent.on_theme_button_clicked, entry.get_text() + ".css", theme_type)
-
-        #Attributes
-        new_button.func = parent.on_theme_button_clicked
-        new_button.path = os.path.join(parent.data_dir, theme_type, entry.get_text() + ".css")
-        new_button.theme_type = theme_type
-        new_button.theme = entry.get_text()
-        new_button.default = False
-
-        already_exists = False
-        for button in flowbox:
-            if(button.get_first_child().theme == new_button.theme):
-                already_exists = True
+                gallery = parent.dark_gallery
 
-        if(not already_exists):
-            flowbox.insert(new_button, -1)
-            flowbox.invalidate_sort()
+        gallery.add_theme(entry.get_text() + ".css")
@@ -57,29 +57,18 @@ sharp_corners_css = """
 class OptionsBox(Gtk.ListBox):
     def __init__(self, parent):
         super().__init__(halign=Gtk.Align.CENTER, selection_mode=Gtk.SelectionMode.NONE)
-        for option, css in zip(["Transparency", "Window borders", "Sharp corners"], [transparency_css, border_css, sharp_corners_css]):
+        for option in ["Transparency", "Window borders", "Sharp corners"]:
             row = Adw.ActionRow(height_request=48)
             row.set_title(_(option))
 
             option = option.split()[0].lower()
             toggle = Gtk.Switch(active=parent.app_settings.get_boolean(option), valign=Gtk.Align.CENTER, hexpand=True, halign=Gtk.Align.END, margin_start=36, margin_end=12)
-            toggle.connect("notify::active", self.on_row_toggled, parent, css, option)
+            toggle.connect("notify::active", self.on_row_toggled, parent, option)
             row.add_suffix(toggle)
             self.add_css_class("boxed-list")
             self.append(row)
 
-            if(parent.app_settings.get_boolean(option)):
-                self.set_active_extra_options(parent, css)
-
-    def set_active_extra_options(self, parent, css):
-        parent.extra_css.add(css)
-
-    def on_row_toggled(self, switch, args, parent, css, key):
-        if(switch.get_active()):
-            parent.extra_css.add(css)
-        else:
-            parent.extra_css.remove(css)
-
+    def on_row_toggled(self, switch, args, parent, key):
         parent.app_settings.set_boolean(key, switch.get_active())
         parent.on_theme_selected()
 
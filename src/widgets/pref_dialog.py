@@ -1,6 +1,17 @@
 import gi, os, shutil
 from gi.repository import Gtk, Adw, GLib
-from .window import reset_shell
+from .applier import reset_shell
+from .wallpaper import forget_fit
+
+# Settings value and label for each encoder in image_modifier
+wallpaper_formats = {
+    "jpeg": _("JPEG"),
+    "jpeg-fast": _("JPEG (fast)"),
+    "png": _("PNG"),
+    "png-fast": _("PNG (fast)"),
+    "webp": _("WebP"),
+    "webp-fast": _("WebP (fast)"),
+}
 
 class ToggleRow(Adw.ActionRow):
     def __init__(self, title, win, parent):
@@ -12,6 +23,10 @@ class ToggleRow(Adw.ActionRow):
             state = win.modify_gtk3_theme
         elif(title[0] == "Generate Gnome Shell Theme"):
             state = win.modify_gnome_shell
+        elif(title[0] == "Flatten GTK-4.0 Theme"):
+            state = win.flatten_gtk4_theme
+        elif(title[0] == "Re-tint Wallpaper"):
+            state = win.retint_wallpaper
         else:
             state = win.run_in_background
 
@@ -40,8 +55,39 @@ class PrefDialog(Adw.PreferencesDialog):
 
         # toggle_group.add(clear_box)
 
-        for title in [("Generate GTK-3.0 Theme", "Highly recommended for all users"), ("Generate Gnome Shell Theme", "For Gnome users"), ("Run in background", "For users who swap between light/dark mode")]:
+        for title in [("Generate GTK-3.0 Theme", "Highly recommended for all users"), ("Generate Gnome Shell Theme", "For Gnome users"), ("Flatten GTK-4.0 Theme", "Smaller stylesheet with every color resolved, so apps start a little faster"), ("Re-tint Wallpaper", "Tints your last tinted wallpaper again whenever the theme changes"), ("Run in background", "For users who swap between light/dark mode")]:
             toggle_group.add(ToggleRow(title, win, self))
+
+        jobs_row = Adw.SpinRow.new_with_range(1, 8, 1)
+        jobs_row.set_title(_("Wallpaper Jobs"))
+        jobs_row.set_subtitle(_("How many wallpapers are tinted at the same time"))
+        jobs_row.set_value(win.app_settings.get_int("wallpaper-jobs"))
+        jobs_row.connect("notify::value", lambda row, pspec: win.app_settings.set_int("wallpaper-jobs", int(row.get_value())))
+        toggle_group.add(jobs_row)
+
+        wallpaper_group = Adw.PreferencesGroup(title=_("Tinted Wallpapers"))
+        page.add(wallpaper_group)
+
+        for key, title, subtitle in [
+            ("wallpaper-fit-monitors", _("Fit to Monitors"), _("Tints at the size your monitors need, much faster for large photos")),
+            ("wallpaper-monitor-variants", _("Copy per Monitor"), _("Also saves a copy sized for each of your monitors")),
+            ("wallpaper-lockscreen-variant", _("Dimmed Lock Screen"), _("Uses a darker copy of the wallpaper on the lock screen")),
+        ]:
+            row = Adw.SwitchRow(title=title, subtitle=subtitle, active=win.app_settings.get_boolean(key))
+            row.connect("notify::active", lambda row, pspec, key=key: win.app_settings.set_boolean(key, row.get_active()))
+            wallpaper_group.add(row)
+
+        format_row = Adw.ComboRow(title=_("Format"), model=Gtk.StringList.new(list(wallpaper_formats.values())))
+        format_row.set_selected(list(wallpaper_formats).index(win.app_settings.get_string("wallpaper-format")))
+        format_row.connect("notify::selected", lambda row, pspec: win.app_settings.set_string("wallpaper-format", list(wallpaper_formats)[row.get_selected()]))
+        wallpaper_group.add(format_row)
+
+        quality_row = Adw.SpinRow.new_with_range(50, 100, 5)
+        quality_row.set_title(_("Quality"))
+        quality_row.set_subtitle(_("Higher keeps more detail in larger files. PNG ignores it"))
+        quality_row.set_value(win.app_settings.get_int("wallpaper-quality"))
+        quality_row.connect("notify::value", lambda row, pspec: win.app_settings.set_int("wallpaper-quality", int(row.get_value())))
+        wallpaper_group.add(quality_row)
         self.add(page)
 
     def on_pref_toggle_switched(self, switch, state, title, win):
@@ -54,6 +100,13 @@ class PrefDialog(Adw.PreferencesDialog):
         elif(title == "Generate Gnome Shell Theme"):
             win.modify_gnome_shell = bool(state)
             self.clear_gnome_shell(bool(state), win)
+        elif(title == "Flatten GTK-4.0 Theme"):
+            win.flatten_gtk4_theme = bool(state)
+            win.on_theme_selected()
+        elif(title == "Re-tint Wallpaper"):
+            win.retint_wallpaper = bool(state)
+            if(not state):
+                forget_fit()
         elif(title == "Run in background"):
             win.run_in_background = bool(state)
             self.change_autostart(bool(state))
@@ -17,24 +17,16 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import gi, os, re
-from gi.repository import Gtk, Adw, Gdk, GLib
+import gi, os, re, hashlib
+from gi.repository import Gtk, Adw, Gdk, GLib, Gio, GObject
 from fortune import fortune
 from .wallpaper_dialog import WallpaperDialog
 from .extra_options_box import OptionsBox
+from .utils import delete_theme, sync_bundled_themes
+from .thumbnail_cache import ThumbnailCache
+from .tracing import span
 
-def flowbox_sort_func(child1: Gtk.FlowBoxChild, child2: Gtk.FlowBoxChild, _):
-    button1 = child1.get_first_child()
-    button2 = child2.get_first_child()
-
-    theme1 = button1.theme.lower()
-    theme2 = button2.theme.lower()
-
-    if(theme1 < theme2):
-        return -1
-    elif(theme1 > theme2):
-        return 1
-    return 0
+dot_keys = ["red_1", "orange_1", "yellow_1", "green_1", "blue_1", "dark_1", "light_1"]
 
 def load_colors_from_css(file_path):
     colors = {}
@@ -48,55 +40,187 @@ def load_colors_from_css(file_path):
                 colors[name] = color.strip()
     return colors
 
-def create_color_thumbnail_button(colors, name, example_text):
-    button = Gtk.Button()
-    box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-    dots = Gtk.Label(vexpand=True, valign=Gtk.Align.END, use_markup=True)
-    dot_txt = ""
-
-    keys_to_show = ["red_1", "orange_1", "yellow_1", "green_1", "blue_1", "dark_1", "light_1"]
-    for key in keys_to_show:
-        color = colors.get(key)
-        if(color):
-            dot_txt += f"<span font_size='20pt' foreground='{color}'> ● </span>"
-
-    dots.set_label(dot_txt)
-    rand = os.urandom(15).hex()
-    css_provider = Gtk.CssProvider()
-    css_provider.load_from_data(f"""
-        .background-{rand} {{
+# All thumbnail colors live in one display-wide stylesheet
+thumbnail_provider = Gtk.CssProvider()
+thumbnail_rules = {}
+thumbnail_reload_pending = False
+thumbnail_provider_added = False
+thumbnail_cache = ThumbnailCache()
+
+def get_thumbnail_class(theme_type, theme):
+    return "thumbnail-" + hashlib.sha1(f"{theme_type}/{theme}".encode()).hexdigest()[:16]
+
+def set_thumbnail_css(css_class, colors):
+    thumbnail_rules[css_class] = f"""
+        .{css_class} {{
             border-radius: 18px;
             background-color: {colors.get("window_bg_color")};
             color: {colors.get("window_fg_color")};
         }}
-    """.encode())
-    Gtk.StyleContext.add_provider_for_display(
-        Gdk.Display.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
-    )
-    button.add_css_class(f'background-{rand}')
-
-    example = Gtk.Label(wrap=True, margin_top=12, margin_bottom=12, hexpand=True, vexpand=True, valign=Gtk.Align.CENTER, halign=Gtk.Align.CENTER, max_width_chars=12)
-    example.set_markup(f"<i><b>{example_text}</b></i>")
-    box.prepend(example)
-    title = Gtk.Label(margin_bottom=12, margin_top=12, label=name)
-    title.set_css_classes(["monospace", "title-2"])
-    box.prepend(title)
-    box.append(dots)
-    button.set_child(box)
-    return button
-
-def symlink_all_in_dir(src, out):
-    os.makedirs(out, exist_ok=True)
-
-    for name in os.listdir(src):
-        src_path = os.path.join(src, name)
-        out_path = os.path.join(out, name)
-
-        if(os.path.isfile(src_path)):
-            if(os.path.exists(out_path)):
-                os.remove(out_path)
-
-            os.symlink(src_path, out_path)
+    """
+    queue_thumbnail_reload()
+
+def remove_thumbnail_css(css_class):
+    if(thumbnail_rules.pop(css_class, None) is not None):
+        queue_thumbnail_reload()
+
+def queue_thumbnail_reload():
+    global thumbnail_reload_pending
+    if(not thumbnail_reload_pending):
+        thumbnail_reload_pending = True
+        # Runs before the next frame is drawn, so every card bound in between shares one reload
+        GLib.idle_add(reload_thumbnail_css, priority=GLib.PRIORITY_HIGH_IDLE)
+
+def reload_thumbnail_css():
+    global thumbnail_reload_pending, thumbnail_provider_added
+    if(not thumbnail_provider_added):
+        Gtk.StyleContext.add_provider_for_display(
+            Gdk.Display.get_default(), thumbnail_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
+        )
+        thumbnail_provider_added = True
+    thumbnail_provider.load_from_data("".join(thumbnail_rules.values()).encode())
+    thumbnail_reload_pending = False
+    return False
+
+class ThemeItem(GObject.Object):
+    __gtype_name__ = "ThemeItem"
+
+    sort_key = GObject.Property(type=str, default="")
+
+    def __init__(self, theme, theme_type, path, default):
+        super().__init__(sort_key=theme.lower())
+        self.theme = theme
+        self.name = theme.replace(".css", "")
+        self.theme_type = theme_type
+        self.path = path
+        self.default = default
+        self.thumbnail = None
+        self.css_class = None
+
+    def load(self):
+        # Only themes that actually get scrolled into view are looked up, and only cache misses are parsed
+        if(self.thumbnail is None):
+            self.thumbnail = thumbnail_cache.lookup(self.path)
+            if(self.thumbnail is None):
+                with span("load_colors_from_css"):
+                    colors = load_colors_from_css(self.path)
+                self.thumbnail = thumbnail_cache.store(self.path, colors, dot_keys)
+            self.css_class = get_thumbnail_class(self.theme_type, self.theme)
+            set_thumbnail_css(self.css_class, self.thumbnail)
+
+class ThemeCard(Gtk.Button):
+    def __init__(self, gallery):
+        super().__init__()
+        self.gallery = gallery
+        self.item = None
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.title = Gtk.Label(margin_bottom=12, margin_top=12)
+        self.title.set_css_classes(["monospace", "title-2"])
+        example = Gtk.Label(wrap=True, margin_top=12, margin_bottom=12, hexpand=True, vexpand=True, valign=Gtk.Align.CENTER, halign=Gtk.Align.CENTER, max_width_chars=12)
+        example.set_markup(f"<i><b>{gallery.snippet}</b></i>")
+        self.dots = Gtk.Picture(vexpand=True, valign=Gtk.Align.END, can_shrink=False, margin_bottom=6)
+
+        box.append(self.title)
+        box.append(example)
+        box.append(self.dots)
+        self.set_child(box)
+        self.connect("clicked", gallery.on_card_clicked)
+
+    def bind(self, item):
+        item.load()
+        self.item = item
+        self.title.set_label(item.name)
+        with span("thumbnail"):
+            self.dots.set_paintable(thumbnail_cache.get_texture(item.thumbnail, self.get_scale_factor()))
+        self.add_css_class(item.css_class)
+        self.update()
+
+    def unbind(self):
+        self.remove_css_class(self.item.css_class)
+        self.item = None
+
+    def update(self):
+        window = self.gallery.parent
+        active = self.item.theme == getattr(window, f"{self.item.theme_type}_theme")
+        deletable = window.delete_mode and not active and not self.item.default
+
+        for css_class, state in [("active-scheme", active), ("delete-action", deletable), ("shake", deletable)]:
+            if(state):
+                self.add_css_class(css_class)
+            else:
+                self.remove_css_class(css_class)
+        self.set_sensitive(not window.delete_mode or deletable)
+
+# The GridView scrolls in a viewport of its own, so only the visible rows get
+# cards. It grows with its content up to the height of the window's scroller,
+# which starts out as the window's default height.
+class ThemeGallery(Gtk.ScrolledWindow):
+    def __init__(self, parent, theme_type, snippet):
+        super().__init__(propagate_natural_height=True, max_content_height=max(parent.get_default_size()[1], 300), hscrollbar_policy=Gtk.PolicyType.NEVER)
+        self.parent = parent
+        self.theme_type = theme_type
+        self.snippet = snippet
+        self.cards = set()
+
+        self.store = Gio.ListStore(item_type=ThemeItem)
+        sort_key = Gtk.PropertyExpression.new(ThemeItem, None, "sort-key")
+        sort_model = Gtk.SortListModel(model=self.store, sorter=Gtk.StringSorter.new(sort_key))
+        self.filter = Gtk.StringFilter.new(sort_key)
+        self.filter.set_ignore_case(False)
+        self.filter.set_match_mode(Gtk.StringFilterMatchMode.SUBSTRING)
+        filter_model = Gtk.FilterListModel(model=sort_model, filter=self.filter)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_setup)
+        factory.connect("bind", lambda _, list_item: list_item.get_child().bind(list_item.get_item()))
+        factory.connect("unbind", lambda _, list_item: list_item.get_child().unbind())
+        factory.connect("teardown", lambda _, list_item: self.cards.discard(list_item.get_child()))
+
+        grid = Gtk.GridView(model=Gtk.NoSelection(model=filter_model), factory=factory, max_columns=3, margin_start=12, margin_end=12)
+        grid.add_css_class("theme-gallery")
+        self.set_child(grid)
+
+    def on_setup(self, factory, list_item):
+        card = ThemeCard(self)
+        self.cards.add(card)
+        list_item.set_child(card)
+
+    def on_card_clicked(self, card):
+        if(self.parent.delete_mode):
+            delete_theme(card, self.parent)
+        else:
+            self.parent.on_theme_button_clicked(card, card.item.theme, self.theme_type)
+
+    def set_search(self, text):
+        self.filter.set_search(text.lower())
+
+    def add_theme(self, theme, default=False):
+        item = ThemeItem(theme, self.theme_type, os.path.join(self.parent.data_dir, self.theme_type, theme), default)
+        position = self.find(theme)
+        if(position is None):
+            self.store.append(item)
+        else:
+            self.store.splice(position, 1, [item])
+
+    def remove_theme(self, item):
+        found, position = self.store.find(item)
+        if(found):
+            self.store.remove(position)
+        if(item.css_class):
+            remove_thumbnail_css(item.css_class)
+        thumbnail_cache.remove(item.path)
+
+    def find(self, theme):
+        for position, item in enumerate(self.store):
+            if(item.theme == theme):
+                return position
+        return None
+
+    def refresh(self):
+        for card in self.cards:
+            if(card.item):
+                card.update()
 
 class ThemePage(Gtk.Box):
     def __init__(self, parent):
@@ -118,7 +242,11 @@ class ThemePage(Gtk.Box):
         self.append(top_box)
         self.append(options_listbox)
 
+        search_entry = Gtk.SearchEntry(placeholder_text=_("Search themes"), halign=Gtk.Align.CENTER, width_request=250, margin_top=12)
+        self.append(search_entry)
+
         snippet = self.get_example_text()
+        self.galleries = []
         for theme_type in ["light", "dark"]:
             self.append(Adw.Clamp(maximum_size=1200, child=Gtk.Separator(margin_start=20, margin_end=20, margin_top=25)))
             reset_button = Gtk.Button(icon_name="reload-symbolic", tooltip_text=_("Reset to default"))
@@ -127,17 +255,17 @@ class ThemePage(Gtk.Box):
 
             default_theme_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), theme_type)
             default_themes = os.listdir(default_theme_path)
-            symlink_all_in_dir(default_theme_path, os.path.join(GLib.get_user_data_dir(), theme_type))
+            sync_bundled_themes(default_theme_path, os.path.join(GLib.get_user_data_dir(), theme_type))
             themes = os.listdir(os.path.join(parent.data_dir, theme_type))
 
+            gallery = ThemeGallery(parent, theme_type, snippet)
             if(theme_type == "light"):
-                parent.light_flowbox = Gtk.FlowBox(column_spacing=12, row_spacing=12, max_children_per_line=3, homogeneous=True, margin_start=12, margin_end=12, selection_mode=Gtk.SelectionMode.NONE)
-                flowbox = parent.light_flowbox
+                parent.light_gallery = gallery
                 parent.light_button = reset_button
             else:
-                parent.dark_flowbox = Gtk.FlowBox(column_spacing=12, row_spacing=12, max_children_per_line=3, homogeneous=True, margin_start=12, margin_end=12, selection_mode=Gtk.SelectionMode.NONE)
-                flowbox = parent.dark_flowbox
+                parent.dark_gallery = gallery
                 parent.dark_button = reset_button
+            self.galleries.append(gallery)
 
             title_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, halign=Gtk.Align.CENTER)
             title = Gtk.Label(label=_(theme_type.capitalize()), margin_end=25)
@@ -145,29 +273,24 @@ class ThemePage(Gtk.Box):
             title_box.append(title); title_box.append(reset_button)
             self.append(title_box)
 
-            flowbox.snippet = snippet
-            for theme in sorted(themes):
-                colors = load_colors_from_css(os.path.join(parent.data_dir, theme_type, theme))
-                btn = create_color_thumbnail_button(colors, theme.replace(".css", ""), flowbox.snippet)
-                btn.connect("clicked", parent.on_theme_button_clicked, theme, theme_type)
-
-                if(theme == parent.dark_theme and theme_type == "dark" or theme == parent.light_theme and theme_type == "light"):
-                    btn.add_css_class("active-scheme")
-                if(theme in default_themes):
-                    btn.default = True
-                else:
-                    btn.default = False
-
-                #Attributes
-                btn.path = os.path.join(parent.data_dir, theme_type, theme)
-                btn.func = parent.on_theme_button_clicked
-                btn.theme = theme
-                btn.theme_type = theme_type
-
-                flowbox.append(btn)
-
-            flowbox.set_sort_func(flowbox_sort_func, None)
-            self.append(Adw.Clamp(maximum_size=900, child=flowbox))
+            gallery.store.splice(0, 0, [
+                ThemeItem(theme, theme_type, os.path.join(parent.data_dir, theme_type, theme), theme in default_themes)
+                for theme in themes
+            ])
+            self.append(Adw.Clamp(maximum_size=900, child=gallery))
+
+        search_entry.connect("search-changed", self.on_search_changed)
+
+    # Called by the window when its scroller is resized
+    def on_viewport_resized(self, adjustment, _):
+        height = int(adjustment.get_page_size())
+        if(height > 0):
+            for gallery in self.galleries:
+                gallery.set_max_content_height(height)
+
+    def on_search_changed(self, entry):
+        for gallery in self.galleries:
+            gallery.set_search(entry.get_text())
 
     def get_example_text(self):
         while(True):
@@ -0,0 +1,154 @@
+# thumbnail_cache.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import gi, os, glob, json, hashlib, math, cairo
+from gi.repository import Gdk, GLib, GObject
+
+dot_size = 16
+dot_spacing = 14
+dots_height = 36
+
+class ScaledTexture(GObject.Object, Gdk.Paintable):
+    # Reports the texture's size in logical pixels so HiDPI renders are not drawn twice as large
+    def __init__(self, texture, scale):
+        super().__init__()
+        self.texture = texture
+        self.scale = scale
+
+    def do_get_intrinsic_width(self):
+        return self.texture.get_width() // self.scale
+
+    def do_get_intrinsic_height(self):
+        return self.texture.get_height() // self.scale
+
+    def do_get_flags(self):
+        return Gdk.PaintableFlags.SIZE | Gdk.PaintableFlags.CONTENTS
+
+    def do_snapshot(self, snapshot, width, height):
+        self.texture.snapshot(snapshot, width, height)
+
+# Entries are keyed on path, mtime and size. An edited theme gets a new key, so the
+# old entry of the same path is dropped when the new one is stored, and entries
+# for files that are gone are dropped when the index is loaded.
+class ThumbnailCache:
+    def __init__(self):
+        self.cache_dir = os.path.join(GLib.get_user_cache_dir(), "rewaita", "thumbnails")
+        self.index_file = os.path.join(self.cache_dir, "index.json")
+        self.textures = {}
+        self.save_pending = False
+        self.index = None
+        self.keys = {} # Real path to its current key
+
+    def load_index(self):
+        if(self.index is None):
+            try:
+                with open(self.index_file, "r") as file:
+                    self.index = json.load(file)
+            except (OSError, ValueError):
+                self.index = {}
+            self.prune()
+        return self.index
+
+    def prune(self):
+        for key, entry in list(self.index.items()):
+            if(not os.path.exists(entry.get("path", ""))):
+                self.forget(key)
+            else:
+                self.keys[entry["path"]] = key
+
+    def forget(self, key):
+        entry = self.index.pop(key, None)
+        if(entry and self.keys.get(entry.get("path")) == key):
+            del self.keys[entry["path"]]
+        for path in glob.glob(os.path.join(glob.escape(self.cache_dir), f"{key}@*x.png")):
+            os.remove(path)
+        for name in [name for name in self.textures if name.startswith(f"{key}@")]:
+            del self.textures[name]
+        self.queue_save()
+
+    # Called before a theme's file is deleted
+    def remove(self, path):
+        self.load_index()
+        key = self.keys.get(os.path.realpath(path))
+        if(key):
+            self.forget(key)
+
+    def queue_save(self):
+        if(not self.save_pending):
+            self.save_pending = True
+            GLib.idle_add(self.save)
+
+    def get_key(self, path):
+        # Bundled themes are symlinks, so key on the file they point to
+        stat = os.stat(path)
+        return hashlib.sha1(f"{os.path.realpath(path)}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:16]
+
+    def lookup(self, path):
+        return self.load_index().get(self.get_key(path))
+
+    def store(self, path, colors, dot_keys):
+        key = self.get_key(path)
+        real_path = os.path.realpath(path)
+        self.load_index()
+        old_key = self.keys.get(real_path)
+        if(old_key and old_key != key):
+            self.forget(old_key)
+        self.keys[real_path] = key
+        self.index[key] = {
+            "key": key,
+            "path": real_path,
+            "window_bg_color": colors.get("window_bg_color"),
+            "window_fg_color": colors.get("window_fg_color"),
+            "dots": [colors[name] for name in dot_keys if colors.get(name)],
+        }
+        self.queue_save()
+        return self.index[key]
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.index_file, "w") as file:
+            json.dump(self.index, file)
+        self.save_pending = False
+        return False
+
+    def get_texture(self, entry, scale):
+        name = f"{entry['key']}@{scale}x"
+        if(name not in self.textures):
+            path = os.path.join(self.cache_dir, f"{name}.png")
+            if(not os.path.exists(path)):
+                self.render_dots(entry["dots"], scale, path)
+            self.textures[name] = ScaledTexture(Gdk.Texture.new_from_filename(path), scale)
+        return self.textures[name]
+
+    def render_dots(self, colors, scale, path):
+        width = len(colors) * (dot_size + dot_spacing) + dot_spacing
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width * scale, dots_height * scale)
+        context = cairo.Context(surface)
+        context.scale(scale, scale)
+
+        for index, color in enumerate(colors):
+            rgba = Gdk.RGBA()
+            if(not rgba.parse(color)):
+                continue
+            context.set_source_rgba(rgba.red, rgba.green, rgba.blue, rgba.alpha)
+            context.arc(dot_spacing + index * (dot_size + dot_spacing) + dot_size / 2, dots_height / 2, dot_size / 2, 0, 2 * math.pi)
+            context.fill()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        surface.write_to_png(path)
@@ -17,11 +17,76 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import os
-from gi.repository import Adw, Gtk, Gio, Gdk, GLib
-from .image_modifier import on_image_opened, make_new_image
+import gi, os
+gi.require_version('XdpGtk4', '1.0')
+from gi.repository import Adw, Gtk, Gio, Gdk, GLib, XdpGtk4
+from .loading_dialog import LoadingDialog
+from .tracing import span
+from .wallpaper import picture_path, fit_path, jobs, get_output_options, set_wallpaper
+from .worker import run_in_worker
 
-picture_path = os.path.join(GLib.get_user_data_dir(), "wallpapers")
+def get_theme_type(parent):
+    return "dark" if parent.pref == 1 else "light"
+
+def load_palette(parent, theme_type, theme):
+    from .theme_page import load_colors_from_css
+    palette_vals = list(load_colors_from_css(os.path.join(parent.data_dir, theme_type, theme)).values())
+    return [c for c in palette_vals if not c.startswith('@')]
+
+# Centers fitted on the preview are reused, so the full size image only has its pixels labelled
+def make_new_image(parent, file_path, quantizer="kmeans", theme=None, blend=1.0, centers=None, theme_type=None):
+    output_base = os.path.join(picture_path, f"{os.path.basename(file_path)}-tinted")
+
+    if(theme is None):
+        theme = parent.dark_theme if parent.pref == 1 else parent.light_theme
+    if(theme_type is None):
+        theme_type = get_theme_type(parent)
+
+    if(theme == "default"):
+        dialog = Adw.AlertDialog.new()
+        dialog.set_body(_("Please select a theme first"))
+
+        dialog.add_response("ok", "_OK")
+
+        dialog.set_close_response("ok")
+        dialog.set_default_response("ok")
+
+        dialog.present(parent)
+        return
+
+    palette_vals = load_palette(parent, theme_type, theme)
+    # Kept so theme changes can tint this image again without fitting it
+    save_fit_path = fit_path if parent.app_settings.get_boolean("retint-wallpaper") else None
+    options = get_output_options(parent.app_settings)
+
+    spinner = LoadingDialog(parent)
+
+    # Runs in the job queue's worker thread, so it must not touch any widget.
+    # The image itself is read, tinted and written by a separate process.
+    def render():
+        if(save_fit_path):
+            os.makedirs(os.path.dirname(save_fit_path), exist_ok=True)
+        with span("wallpaper tint", quantizer=quantizer):
+            return run_in_worker(f"{__package__}.image_modifier", "tint_file", file_path, output_base, palette_vals, blend, quantizer, centers, save_fit_path, **options)
+
+    def on_done(outputs, error):
+        spinner.set_can_close(True), spinner.close()
+        if(error):
+            print(f"Could not tint {file_path}: {error}")
+            return
+        set_wallpaper(outputs, XdpGtk4.parent_new_gtk(parent), preview=True)
+
+    # The same image with the same palette is only tinted once, however often it is dropped
+    if(jobs.submit(("tint", file_path, tuple(palette_vals), quantizer, blend), render, on_done)):
+        spinner.present(parent)
+
+# Settings value and label for each quantizer in image_modifier
+quantizer_names = {
+    "kmeans": _("K-means (slow, most accurate)"),
+    "kmeans-lab": _("Perceptual K-means (slow, closest to the eye)"),
+    "median-cut": _("Median cut (fast)"),
+    "octree": _("Octree (fastest)"),
+}
 
 class WallpaperDialog(Adw.Dialog):
     def __init__(self, parent):
@@ -32,9 +97,7 @@ class WallpaperDialog(Adw.Dialog):
         page.append(message_area)
 
         def on_drop_file(target, value, x, y):
-            file_path = value.get_path() or value.get_uri()
-            make_new_image(parent, file_path)
-            return True
+            return self.open_file(value)
 
         def on_open_image(button):
             file_filter_image = Gtk.FileFilter()
@@ -44,7 +107,7 @@ class WallpaperDialog(Adw.Dialog):
             file_filter_image.add_mime_type("image/jpeg")
             file_filter_image.add_mime_type("image/webp")
             file_dialog = Gtk.FileDialog(default_filter=file_filter_image)
-            file_dialog.open(parent, None, on_image_opened, parent)
+            file_dialog.open(parent, None, self.on_image_opened)
 
         warning_label = Gtk.Label(wrap=True, margin_top=24, justify=Gtk.Justification.CENTER, halign=Gtk.Align.CENTER, label=_("This feature is still under development. Under 4k resolution is recommended."))
         warning_label.set_css_classes(["warning", "bold"])
@@ -70,6 +133,20 @@ class WallpaperDialog(Adw.Dialog):
         open_file_button.set_css_classes(["suggested-action", "pill"])
         dir_button.set_css_classes(["suggested-action", "pill"])
 
+        self.parent = parent
+        self.app_settings = parent.app_settings
+        self.file_path = None
+        self.preview_fit = None
+        self.preview_serial = 0
+        self.quantizer_dropdown = Gtk.DropDown.new_from_strings(list(quantizer_names.values()))
+        self.quantizer_dropdown.set_selected(list(quantizer_names).index(self.app_settings.get_string("wallpaper-quantizer")))
+        self.quantizer_dropdown.connect("notify::selected", self.on_quantizer_changed)
+
+        quantizer_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12, halign=Gtk.Align.CENTER)
+        quantizer_box.append(Gtk.Label(label=_("Color Extraction")))
+        quantizer_box.append(self.quantizer_dropdown)
+        message_area.append(quantizer_box)
+
         drop_target = Gtk.DropTarget.new(Gio.File, Gdk.DragAction.COPY)
         drop_target.connect("drop", on_drop_file)
         drop_area = Gtk.Box(margin_start=12, margin_end=12, margin_top=12, margin_bottom=12, height_request=80, hexpand=True)
@@ -80,4 +157,129 @@ class WallpaperDialog(Adw.Dialog):
         drop_area.add_controller(drop_target)
 
         message_area.append(drop_area)
-        self.set_child(page)
+
+        # Hidden until an image is picked. Theme and blend only repaint the preview,
+        # the full size image is made once the user applies it.
+        self.preview_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12, visible=False)
+        self.preview = Gtk.Picture(content_fit=Gtk.ContentFit.CONTAIN, height_request=220)
+        self.preview.add_css_class("card")
+        self.preview_box.append(self.preview)
+
+        self.theme_type = None
+        self.themes = []
+        self.theme_dropdown = Gtk.DropDown.new_from_strings([])
+        self.load_themes()
+        self.theme_dropdown.connect("notify::selected", lambda dropdown, pspec: self.update_preview())
+
+        theme_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12, halign=Gtk.Align.CENTER)
+        theme_box.append(Gtk.Label(label=_("Theme")))
+        theme_box.append(self.theme_dropdown)
+        self.preview_box.append(theme_box)
+
+        self.blend_scale = Gtk.Scale.new_with_range(Gtk.Orientation.HORIZONTAL, 0, 100, 5)
+        self.blend_scale.set_value(100)
+        self.blend_scale.set_hexpand(True)
+        self.blend_scale.connect("value-changed", lambda scale: self.update_preview())
+
+        blend_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        blend_box.append(Gtk.Label(label=_("Blend")))
+        blend_box.append(self.blend_scale)
+        self.preview_box.append(blend_box)
+
+        apply_button = Gtk.Button(label=_("Set as Wallpaper"), halign=Gtk.Align.CENTER)
+        apply_button.set_css_classes(["suggested-action", "pill"])
+        apply_button.connect("clicked", self.on_apply)
+        self.preview_box.append(apply_button)
+
+        message_area.append(self.preview_box)
+        self.toast_overlay = Adw.ToastOverlay(child=page)
+        self.set_child(self.toast_overlay)
+
+    # The dialog is built once, so the list is read again every time it is shown.
+    # The type is kept with it, a light/dark switch must not mix the two folders.
+    def load_themes(self):
+        self.theme_type = get_theme_type(self.parent)
+        self.themes = sorted(os.listdir(os.path.join(self.parent.data_dir, self.theme_type)))
+        self.theme_dropdown.set_model(Gtk.StringList.new([theme.replace(".css", "") for theme in self.themes]))
+        current_theme = self.parent.dark_theme if self.parent.pref == 1 else self.parent.light_theme
+        if(current_theme in self.themes):
+            self.theme_dropdown.set_selected(self.themes.index(current_theme))
+
+    def present(self, parent):
+        self.load_themes()
+        super().present(parent)
+
+    def get_quantizer(self):
+        return list(quantizer_names)[self.quantizer_dropdown.get_selected()]
+
+    def get_theme(self):
+        selected = self.theme_dropdown.get_selected()
+        return self.themes[selected] if selected < len(self.themes) else "default"
+
+    def on_image_opened(self, file_dialog, result):
+        self.open_file(file_dialog.open_finish(result))
+
+    # Pillow only opens local files, so anything without a path is turned away
+    def open_file(self, file):
+        file_path = file.get_path()
+        if(file_path is None):
+            self.toast_overlay.dismiss_all()
+            self.toast_overlay.add_toast(Adw.Toast(timeout=3, title=_("Only local files can be tinted")))
+            return False
+        self.load_preview(file_path)
+        return True
+
+    def on_quantizer_changed(self, dropdown, pspec):
+        self.app_settings.set_string("wallpaper-quantizer", self.get_quantizer())
+        if(self.file_path):
+            self.load_preview(self.file_path)
+
+    # Fits the palette on a small copy in a thread. Only the latest request is shown,
+    # in case another image or quantizer was picked in the meantime.
+    def load_preview(self, file_path):
+        from .image_modifier import load_preview, fit_palette
+
+        self.file_path = file_path
+        self.preview_serial += 1
+        serial = self.preview_serial
+        quantizer = self.get_quantizer()
+        fit = {}
+
+        def task_func(task, source_object, task_data, cancellable):
+            try:
+                with span("wallpaper preview", quantizer=quantizer):
+                    img = load_preview(file_path)
+                    labels, centers = fit_palette(img, quantizer=quantizer)
+                fit.update(size=img.size, labels=labels, centers=centers, quantizer=quantizer)
+            except Exception as e:
+                print(f"Could not preview {file_path}: {e}")
+            task.return_value(serial)
+
+        def on_done(task, result, user_data=None):
+            if(serial != self.preview_serial):
+                return
+            self.preview_fit = fit or None
+            self.preview_box.set_visible(bool(fit))
+            self.update_preview()
+
+        task = Gio.Task.new(None, None, on_done)
+        task.run_in_thread(task_func)
+
+    # Only the preview's few clusters are recolored, so this is fast enough for every slider step
+    def update_preview(self):
+        from .image_modifier import blend_palette, render_palette
+
+        theme = self.get_theme()
+        if(not self.preview_fit or theme == "default"):
+            return
+
+        fit = self.preview_fit
+        colors = blend_palette(fit["centers"], load_palette(self.parent, self.theme_type, theme), self.blend_scale.get_value() / 100)
+        img = render_palette(fit["size"], fit["labels"], colors)
+        width, height = img.size
+        texture = Gdk.MemoryTexture.new(width, height, Gdk.MemoryFormat.R8G8B8, GLib.Bytes.new(img.tobytes()), width * 3)
+        self.preview.set_paintable(texture)
+
+    def on_apply(self, button):
+        fit = self.preview_fit
+        make_new_image(self.parent, self.file_path, fit["quantizer"], self.get_theme(), self.blend_scale.get_value() / 100, fit["centers"], self.theme_type)
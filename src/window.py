@@ -17,39 +17,13 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import os, shutil, gi, re
+import os, gi
 gi.require_version('Xdp', '1.0')
 from gi.repository import Adw, Gdk, Gio, GLib, Gtk, Xdp
-from collections import defaultdict
-from .utils import parse_gtk_theme, set_to_default, delete_items, set_gtk3_theme, get_accent_color, add_css_provider
-from .custom_theme_page import CustomPage
+from .utils import delete_items, add_css_provider, get_portal_settings
 from .theme_page import ThemePage
 from .window_control_box import WindowControlBox
-
-if("GNOME" in GLib.getenv("XDG_CURRENT_DESKTOP")):
-    bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
-    proxy = Gio.DBusProxy.new_sync(
-        bus,
-        Gio.DBusProxyFlags.NONE,
-        None,
-        'org.gnome.Shell.Extensions',
-        '/org/gnome/Shell/Extensions',
-        'org.gnome.Shell.Extensions',
-        None
-    )
-
-def reset_shell():
-    proxy.call_sync("DisableExtension",
-        GLib.Variant("(s)", ("user-theme@gnome-shell-extensions.gcampax.github.com",)),
-        Gio.DBusCallFlags.NONE, -1, None)
-
-    proxy.call_sync("EnableExtension",
-        GLib.Variant("(s)", ("user-theme@gnome-shell-extensions.gcampax.github.com",)),
-        Gio.DBusCallFlags.NONE, -1, None)
-
-gtk3_config_dir = os.path.join(os.path.expanduser("~/.config"), "gtk-3.0")
-gtk4_config_dir = os.path.join(os.path.expanduser("~/.config"), "gtk-4.0")
-gnome_shell_dir = os.path.join(GLib.getenv("HOME"), ".local", "share", "themes")
+from .tracing import span
 
 @Gtk.Template(resource_path='/io/github/swordpuffin/rewaita/window.ui')
 class RewaitaWindow(Adw.ApplicationWindow):
@@ -60,11 +34,11 @@ class RewaitaWindow(Adw.ApplicationWindow):
     toast_overlay = Gtk.Template.Child()
     delete_button = Gtk.Template.Child()
     endbox = Gtk.Template.Child()
-    extra_css = set()
-    window_control_css = ""
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        with span("load_prefs"):
+            self.load_prefs()
 
         css_provider = Gtk.CssProvider()
         css_provider.load_from_data(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "styles.css")).read())
@@ -75,18 +49,11 @@ class RewaitaWindow(Adw.ApplicationWindow):
         if(os.path.exists(os.path.join(GLib.get_user_data_dir(), "prefs.json"))):
             os.remove(os.path.join(GLib.get_user_data_dir(), "prefs.json"))
 
-        #Makes necessary directories
-        for path in [gtk3_config_dir, gtk4_config_dir, gnome_shell_dir]:
-            os.makedirs(path, exist_ok=True)
-
         delete = Gio.SimpleAction.new(name="trash")
         delete.connect("activate", delete_items, self.delete_button, self)
         self.add_action(delete)
 
-        if(self.window_control != "default"):
-            self.window_control_css = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "window-controls", f"{self.window_control}.css")).read()
-        self.portal = Xdp.Portal()
-        self.settings = self.portal.get_settings()
+        self.settings = get_portal_settings()
         self.pref = self.settings.read_uint("org.freedesktop.appearance", "color-scheme")
 
         scroll_box = Gtk.ScrolledWindow(hexpand=True)
@@ -94,15 +61,18 @@ class RewaitaWindow(Adw.ApplicationWindow):
 
         self.controls = self.endbox.get_parent().get_last_child() #Gets the window controls
 
-        self.theme_page = ThemePage(self)
+        with span("ThemePage"):
+            self.theme_page = ThemePage(self)
         self.theme_page.append(WindowControlBox(self, self.window_control))
-        self.custom_page = CustomPage(self)
+        scroll_box.get_vadjustment().connect("notify::page-size", self.theme_page.on_viewport_resized)
+        self.custom_page = None
+        self.custom_clamp = Adw.Clamp(maximum_size=850)
 
         stack = Adw.ViewStack(transition_duration=200, vhomogeneous=False)
         stack.connect("notify::visible-child", self.on_page_changed)
         self.switcher.set_stack(stack)
         stack.add_titled_with_icon(self.theme_page, "settings", _("Theming"), "brush-symbolic")
-        stack.add_titled_with_icon(Adw.Clamp(child=self.custom_page, maximum_size=850), "custom", _("Custom"), "hammer-symbolic")
+        stack.add_titled_with_icon(self.custom_clamp, "custom", _("Custom"), "hammer-symbolic")
 
         box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         box.append(stack)
@@ -111,91 +81,49 @@ class RewaitaWindow(Adw.ApplicationWindow):
     light_theme = ""
     dark_theme = ""
     pref = 0
+    delete_mode = False
     data_dir = GLib.get_user_data_dir()
 
     def on_page_changed(self, stack, _):
         if(stack.get_visible_child_name() == "custom"):
+            # GtkSource and the color rows are only loaded once the page is actually opened
+            if(self.custom_page is None):
+                from .custom_theme_page import CustomPage
+                self.custom_page = CustomPage(self)
+                self.custom_clamp.set_child(self.custom_page)
             self.delete_button.set_visible(False)
         else:
             self.delete_button.set_visible(True)
 
-    template_file_content = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "gnome-shell-template.css")).read()
-    gtk3_template_file_content = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "gtk3-template", "gtk.css")).read()
+    def load_prefs(self):
+        self.app_settings = self.get_application().app_settings
+
+        self.light_theme = self.app_settings.get_string("light-theme")
+        self.dark_theme = self.app_settings.get_string("dark-theme")
+        self.window_control = self.app_settings.get_string("window-controls")
+        self.modify_gtk3_theme = self.app_settings.get_boolean("modify-gtk3-theme")
+        self.modify_gnome_shell = self.app_settings.get_boolean("modify-gnome-shell")
+        self.flatten_gtk4_theme = self.app_settings.get_boolean("flatten-gtk4-theme")
+        self.retint_wallpaper = self.app_settings.get_boolean("retint-wallpaper")
+        self.run_in_background = self.app_settings.get_boolean("run-in-background")
 
     def on_theme_selected(self):
         self.pref = self.settings.read_uint("org.freedesktop.appearance", "color-scheme")
         if(self.pref == 1):
             theme_name = self.dark_theme
-            theme_type = "dark"
         else:
             theme_name = self.light_theme
-            theme_type = "light"
 
         self.save_prefs()
 
-        extra_css_string = ""
-        for item in self.extra_css:
-            extra_css_string += item
-        extras = self.window_control_css + extra_css_string
-
-        if(theme_name.lower() == "default"):
-            set_to_default([gtk3_config_dir, gtk4_config_dir], theme_type, reset_shell, extras)
-            return
-
-        theme_file = os.path.join(self.data_dir, theme_type, theme_name)
-        self.controls.set_css_classes([self.window_control])
-        gtk_css = open(theme_file).read()
-        self.toast_overlay.dismiss_all()
-        self.toast_overlay.add_toast(Adw.Toast(timeout=3, title=(_("Change GNOME shell theme to 'Rewaita' and reboot for full changes"))))
-
-        color_pattern = r'@define-color\s+([a-z0-9_]+)\s+(#[a-fA-F0-9]+|@[a-z0-9_]+);'
-        references = defaultdict(list)
-        colors = dict()
-
-        for match in re.finditer(color_pattern, gtk_css):
-            name, value = match.groups()
-            if(value.startswith('@')):
-                ref_name = value[1:]
-                references[ref_name].append(name)
-            else:
-                colors[name] = value
-
-        for ref_name, dependent_names in references.items():
-            if(ref_name in colors):
-                for name in dependent_names:
-                    colors[name] = colors[ref_name]
-
-        accent_color = get_accent_color(colors.values())
-        colors["accent_color"] = accent_color
-        extras = "\n" + extras + f"\n@define-color accent_bg_color {accent_color};\n@define-color accent_fg_color @window_bg_color;"
-
-        try:
-            shutil.copy(theme_file, os.path.join(gtk4_config_dir, "gtk.css"))
-            with open(os.path.join(gtk4_config_dir, "gtk.css"), "a") as file:
-                file.write(extras)
-        except Exception as e:
-            print(f"Error moving file: {e}")
-
-        add_css_provider(open(theme_file).read() + extras, accent_color)
-        parse_gtk_theme(
-            colors,
-            self.template_file_content,
-            os.path.join(os.path.dirname(os.path.abspath(__file__)), "gnome-shell-template.css"),
-            self.gtk3_template_file_content,
-            self.modify_gtk3_theme,
-            self.modify_gnome_shell,
-            self.app_settings,
-            reset_shell
-        )
+        if(theme_name.lower() != "default"):
+            self.controls.set_css_classes([self.window_control])
+            self.toast_overlay.dismiss_all()
+            self.toast_overlay.add_toast(Adw.Toast(timeout=3, title=(_("Change GNOME shell theme to 'Rewaita' and reboot for full changes"))))
 
-        if(self.modify_gtk3_theme):
-            set_gtk3_theme(gtk3_config_dir, self.window_control)
+        add_css_provider(*self.get_application().applier.apply())
 
     def on_window_control_clicked(self, button, control_file, window, flowbox):
-        if(control_file != "default"):
-            self.window_control_css = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "window-controls", f"{control_file}.css")).read()
-        else:
-            self.window_control_css = ""
         for control in flowbox:
             control_button = control.get_first_child()
             control_button.remove_css_class("active-scheme")
@@ -222,15 +150,9 @@ class RewaitaWindow(Adw.ApplicationWindow):
             self.toast_overlay.add_toast(Adw.Toast(timeout=3, title=(_(f"{theme_type.capitalize()} theme set to: {theme_name.replace('.css', '')}"))))
 
         if(theme_type == "dark"):
-            flowbox_type = self.dark_flowbox
+            self.dark_gallery.refresh()
         elif(theme_type == "light"):
-            flowbox_type = self.light_flowbox
-
-        for flowbox in flowbox_type:
-            for theme in flowbox:
-                theme.remove_css_class("active-scheme")
-
-        if(button.get_icon_name() != "reload-symbolic"): button.add_css_class("active-scheme")
+            self.light_gallery.refresh()
 
     def save_prefs(self):
         self.app_settings.set_string("light-theme", self.light_theme)
@@ -238,4 +160,6 @@ class RewaitaWindow(Adw.ApplicationWindow):
         self.app_settings.set_string("window-controls", self.window_control)
         self.app_settings.set_boolean("modify-gtk3-theme", self.modify_gtk3_theme)
         self.app_settings.set_boolean("modify-gnome-shell", self.modify_gnome_shell)
+        self.app_settings.set_boolean("flatten-gtk4-theme", self.flatten_gtk4_theme)
+        self.app_settings.set_boolean("retint-wallpaper", self.retint_wallpaper)
         self.app_settings.set_boolean("run-in-background", self.run_in_background)
@@ -0,0 +1,35 @@
+# worker.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Runs image jobs in a new process that exits once the job returns. A large
+# image leaves hundreds of MB with the allocator that would never go back to the
+# system, and the background service runs all day. The job is passed by module
+# and function name, so NumPy and Pillow are only ever imported by the worker.
+# Spawned, since forking a process that runs GTK and threads is not safe.
+
+import importlib, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+def call(module, func, args, kwargs):
+    return getattr(importlib.import_module(module), func)(*args, **kwargs)
+
+# module is a full name, e.g. f"{__package__}.image_modifier"
+def run_in_worker(module, func, *args, **kwargs):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), max_tasks_per_child=1) as executor:
+        return executor.submit(call, module, func, args, kwargs).result()
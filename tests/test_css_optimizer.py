@@ -0,0 +1,70 @@
+# test_css_optimizer.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# The flattened GTK4 sheet must define the same colors as the plain one, for
+# every bundled theme and window-control style, and must leave CSS pasted on
+# the Custom page working the way GTK reads it.
+#
+#   python -m unittest discover tests
+
+import os, unittest
+
+from benchmarks.common import themes_dir
+from benchmarks.gtk4_css import build
+from src.css_optimizer import flatten_css, optimize_css, resolve_palette, split_selectors, parse
+
+class FlattenTest(unittest.TestCase):
+    def test_bundled_palettes(self):
+        for theme_type in ["light", "dark"]:
+            for theme in sorted(os.listdir(os.path.join(themes_dir, theme_type))):
+                for window_control in ["default", "colored", "macos"]:
+                    with self.subTest(theme=f"{theme_type}/{theme}", window_control=window_control):
+                        css = build(theme_type, theme, window_control)
+                        self.assertEqual(resolve_palette(parse(css)), resolve_palette(parse(flatten_css(css))))
+
+    def test_colors_are_literals(self):
+        flat = flatten_css("@define-color a #123456; @define-color b @a; @define-color a #abcdef; .x { color: @b; }")
+        self.assertEqual(resolve_palette(parse(flat)), {"a": "#abcdef", "b": "#abcdef"})
+        self.assertEqual(flat.count("@define-color a "), 1)
+
+    # GTK drops the value it cannot parse, so the one before it has to stay
+    def test_fallback_kept(self):
+        for css in [".x { color: red; color: -gtk-foo(1); }", ".x { color: red; } .x { color: -gtk-foo(1); }"]:
+            with self.subTest(css=css):
+                flat = flatten_css(css)
+                self.assertIn("color:red", flat)
+                self.assertIn("color:-gtk-foo(1)", flat)
+
+    def test_known_value_replaces(self):
+        self.assertEqual(flatten_css(".x { color: red; color: alpha(#fff, 0.5); }"), ".x{color:alpha(#fff,0.5)}")
+
+    # One invalid selector makes GTK drop the whole rule, so lists are kept together
+    def test_selector_lists_kept(self):
+        flat = flatten_css(".x, .y:bad { color: red; } .x { margin: 0; } .z { color: red; }")
+        self.assertEqual(flat, ".x,.y:bad{color:red}.x{margin:0}.z{color:red}")
+
+class OptimizeTest(unittest.TestCase):
+    def test_split_selectors(self):
+        self.assertEqual(split_selectors('.x[title="a, b"], .y:not(.a, .b), .z'), ['.x[title="a, b"]', ".y:not(.a,.b)", ".z"])
+
+    def test_override_dropped(self):
+        self.assertEqual(optimize_css("/* a */ .x { color: red; } .x { color: blue; }"), ".x{color:blue}")
+
+if(__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,55 @@
+# test_image_modifier.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Arrays handed to the library API, in the shapes images usually come in.
+#
+#   python -m unittest discover tests
+
+import unittest
+
+import numpy as np
+
+from src.image_modifier import load_pixels, remap_palette
+
+palette = ["#1e1e2e", "#f38ba8", "#a6e3a1", "#f9e2af", "#89b4fa", "#cba6f7", "#94e2d5", "#cdd6f4"]
+
+class ArraySourceTest(unittest.TestCase):
+    def setUp(self):
+        self.rgb = np.random.default_rng(0).integers(0, 256, (40, 60, 3), dtype=np.uint8)
+
+    def test_rgb_not_copied(self):
+        self.assertTrue(np.shares_memory(load_pixels(self.rgb), self.rgb))
+
+    def test_gray_and_alpha(self):
+        alpha = np.dstack([self.rgb, np.full((40, 60), 255, np.uint8)])
+        for source in [self.rgb[..., 0], self.rgb[..., :1], alpha]:
+            with self.subTest(shape=source.shape):
+                pixels = load_pixels(source)
+                self.assertEqual(pixels.shape, (40, 60, 3))
+                self.assertEqual(remap_palette(source, palette).size, (60, 40))
+        np.testing.assert_array_equal(load_pixels(alpha), self.rgb)
+
+    def test_unsupported(self):
+        for source in [self.rgb.astype(np.float32), self.rgb[..., :2], self.rgb[np.newaxis]]:
+            with self.subTest(shape=source.shape, dtype=source.dtype):
+                with self.assertRaisesRegex(ValueError, r"expected \(h, w, 3\) uint8"):
+                    load_pixels(source)
+
+if(__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,140 @@
+# test_startup_imports.py
+#
+# Copyright 2025 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# NumPy and Pillow are only for tinting wallpapers, so neither the window nor
+# the background service may load them at startup. The modules are imported
+# from a staged copy of the package in a fresh interpreter. GTK itself is
+# imported first and is not counted against the budget.
+#
+# Without PyGObject, or without a display, gi and cairo are replaced by stand-ins
+# that accept any attribute, call or subclass. That cannot tell whether GTK is
+# used correctly, only what each module imports, which is all this checks.
+#
+#   python -m unittest discover tests
+
+import os, sys, json, shutil, unittest, tempfile, subprocess, importlib.util
+
+from benchmarks.common import stage_package
+
+# Modules that need nothing but the standard library
+plain_modules = ["tracing", "colors", "css_optimizer", "worker"]
+# Everything the window and the background service load before the first frame
+gtk_modules = ["utils", "applier", "wallpaper", "window", "main"]
+heavy_modules = ["numpy", "PIL"]
+import_budget_ms = 250
+
+stub = """
+import sys, types, tempfile
+user_dir = tempfile.mkdtemp()
+path_functions = {"get_user_data_dir", "get_user_cache_dir", "get_user_config_dir", "get_home_dir", "getenv"}
+
+class StubType(type):
+    def __getattr__(cls, name):
+        if(name.startswith("__")):
+            raise AttributeError(name)
+        if(name in path_functions):
+            return lambda *args: user_dir
+        value = StubType(name, (Stub,), {})
+        setattr(cls, name, value)
+        return value
+
+class Stub(metaclass=StubType):
+    def __init__(self, *args, **kwargs):
+        pass
+    # Decorators such as Gtk.Template(...) hand back what they wrap
+    def __call__(self, *args, **kwargs):
+        if(len(args) == 1 and callable(args[0])):
+            return args[0]
+        return Stub()
+    def __getattr__(self, name):
+        if(name.startswith("__")):
+            raise AttributeError(name)
+        return Stub()
+    def __or__(self, other):
+        return self
+    __ror__ = __or__
+
+class StubModule(types.ModuleType):
+    def __getattr__(self, name):
+        if(name.startswith("__")):
+            raise AttributeError(name)
+        value = StubType(name, (Stub,), {})
+        setattr(self, name, value)
+        return value
+
+gi = types.ModuleType("gi")
+gi.require_version = lambda *args: None
+gi.repository = StubModule("gi.repository")
+sys.modules.update({"gi": gi, "gi.repository": gi.repository, "cairo": StubModule("cairo")})
+"""
+
+script = """
+import sys, json, time, gettext, importlib
+gettext.install("rewaita")
+modules = sys.argv[2:]
+if(sys.argv[1] == "stub"):
+    exec(%r)
+elif(set(modules) - {%s}):
+    import gi
+    gi.require_version("Gtk", "4.0")
+    gi.require_version("Adw", "1")
+    gi.require_version("Xdp", "1.0")
+    from gi.repository import Gtk, Gdk, Gio, GLib, Adw, Xdp
+begin = time.perf_counter()
+for name in modules:
+    importlib.import_module("rewaita." + name)
+print(json.dumps({"ms": (time.perf_counter() - begin) * 1000, "heavy": [name for name in %r if name in sys.modules]}))
+""" % (stub, ", ".join(repr(name) for name in plain_modules), heavy_modules)
+
+# Real GTK needs PyGObject and a display to load Gtk 4
+def has_gtk():
+    return importlib.util.find_spec("gi") is not None and bool(os.environ.get("WAYLAND_DISPLAY") or os.environ.get("DISPLAY"))
+
+class StartupImportTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(prefix="rewaita-src-")
+        stage_package(cls.directory)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def import_fresh(self, modules, gtk="real"):
+        process = subprocess.run([sys.executable, "-c", script, gtk] + modules, cwd=self.directory, capture_output=True, text=True)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        return json.loads(process.stdout.splitlines()[-1])
+
+    def check(self, modules, gtk="real"):
+        result = self.import_fresh(modules, gtk)
+        self.assertEqual(result["heavy"], [], f"{', '.join(result['heavy'])} loaded at startup")
+        self.assertLess(result["ms"], import_budget_ms, f"startup imports took {result['ms']:.0f} ms")
+
+    def test_plain_modules(self):
+        self.check(plain_modules)
+
+    # fortune is a pure Python dependency of the theme page, pip install fortune-python
+    @unittest.skipUnless(importlib.util.find_spec("fortune"), "needs fortune-python")
+    def test_gtk_modules(self):
+        for module in gtk_modules:
+            with self.subTest(module=module):
+                self.check([module], "real" if has_gtk() else "stub")
+
+if(__name__ == "__main__"):
+    unittest.main()